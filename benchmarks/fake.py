@@ -0,0 +1,422 @@
+# Copyright (c) 2021-2022 VincentRPS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+A local stand-in for Discord's REST API, used by the benchmarks to load test
+:class:`~trak.internal.http.HTTPClient`.
+
+Every route in ``GuildRoutes`` and ``EmojiRoutes`` is served with placeholder data, and
+requests are held to per-bucket, shared and global ratelimits which answer with the same
+headers and 429 bodies Discord does.
+"""
+import asyncio
+import hashlib
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiohttp import web
+
+from trak import utils
+
+__all__ = ('BucketLimit', 'FakeDiscord', 'ROUTES')
+
+# every method and template served, in match order, literal segments before parameters
+ROUTES: tuple[tuple[str, str], ...] = (
+    ('GET', '/gateway'),
+    ('GET', '/gateway/bot'),
+    ('GET', '/users/@me'),
+    ('PATCH', '/users/@me'),
+    ('POST', '/guilds'),
+    ('GET', '/guilds/{guild_id}'),
+    ('PATCH', '/guilds/{guild_id}'),
+    ('DELETE', '/guilds/{guild_id}'),
+    ('GET', '/guilds/{guild_id}/preview'),
+    ('GET', '/guilds/{guild_id}/channels'),
+    ('POST', '/guilds/{guild_id}/channels'),
+    ('PATCH', '/guilds/{guild_id}/channels'),
+    ('GET', '/guilds/{guild_id}/threads/active'),
+    ('GET', '/guilds/{guild_id}/members'),
+    ('GET', '/guilds/{guild_id}/members/search'),
+    ('PATCH', '/guilds/{guild_id}/members/@me'),
+    ('GET', '/guilds/{guild_id}/members/{user_id}'),
+    ('PUT', '/guilds/{guild_id}/members/{user_id}'),
+    ('PATCH', '/guilds/{guild_id}/members/{user_id}'),
+    ('DELETE', '/guilds/{guild_id}/members/{user_id}'),
+    ('PUT', '/guilds/{guild_id}/members/{user_id}/roles/{role_id}'),
+    ('DELETE', '/guilds/{guild_id}/members/{user_id}/roles/{role_id}'),
+    ('GET', '/guilds/{guild_id}/bans'),
+    ('GET', '/guilds/{guild_id}/bans/{user_id}'),
+    ('PUT', '/guilds/{guild_id}/bans/{user_id}'),
+    ('DELETE', '/guilds/{guild_id}/bans/{user_id}'),
+    ('GET', '/guilds/{guild_id}/roles'),
+    ('POST', '/guilds/{guild_id}/roles'),
+    ('PATCH', '/guilds/{guild_id}/roles'),
+    ('PATCH', '/guilds/{guild_id}/roles/{role_id}'),
+    ('DELETE', '/guilds/{guild_id}/roles/{role_id}'),
+    ('POST', '/guilds/{guild_id}/mfa'),
+    ('GET', '/guilds/{guild_id}/prune'),
+    ('POST', '/guilds/{guild_id}/prune'),
+    ('GET', '/guilds/{guild_id}/regions'),
+    ('GET', '/guilds/{guild_id}/invites'),
+    ('GET', '/guilds/{guild_id}/integrations'),
+    ('DELETE', '/guilds/{guild_id}/integrations/{integration_id}'),
+    ('GET', '/guilds/{guild_id}/widget'),
+    ('PATCH', '/guilds/{guild_id}/widget'),
+    ('GET', '/guilds/{guild_id}/widget.json'),
+    ('GET', '/guilds/{guild_id}/widget.png'),
+    ('GET', '/guilds/{guild_id}/vanity-url'),
+    ('GET', '/guilds/{guild_id}/welcome-screen'),
+    ('PATCH', '/guilds/{guild_id}/welcome-screen'),
+    ('PATCH', '/guilds/{guild_id}/voice-states/@me'),
+    ('PATCH', '/guilds/{guild_id}/voice-states/{user_id}'),
+    ('GET', '/guilds/{guild_id}/emojis'),
+    ('POST', '/guilds/{guild_id}/emojis'),
+    ('GET', '/guilds/{guild_id}/emojis/{emoji_id}'),
+    ('PATCH', '/guilds/{guild_id}/emojis/{emoji_id}'),
+    ('DELETE', '/guilds/{guild_id}/emojis/{emoji_id}'),
+    ('POST', '/channels/{channel_id}/messages'),
+    ('POST', '/webhooks/{webhook_id}/{webhook_token}'),
+)
+
+# routes answered with 204 No Content
+_NO_CONTENT = frozenset(
+    (
+        ('DELETE', '/guilds/{guild_id}'),
+        ('PATCH', '/guilds/{guild_id}/channels'),
+        ('DELETE', '/guilds/{guild_id}/members/{user_id}'),
+        ('PUT', '/guilds/{guild_id}/members/{user_id}/roles/{role_id}'),
+        ('DELETE', '/guilds/{guild_id}/members/{user_id}/roles/{role_id}'),
+        ('PUT', '/guilds/{guild_id}/bans/{user_id}'),
+        ('DELETE', '/guilds/{guild_id}/bans/{user_id}'),
+        ('DELETE', '/guilds/{guild_id}/roles/{role_id}'),
+        ('DELETE', '/guilds/{guild_id}/integrations/{integration_id}'),
+        ('PATCH', '/guilds/{guild_id}/voice-states/@me'),
+        ('PATCH', '/guilds/{guild_id}/voice-states/{user_id}'),
+        ('DELETE', '/guilds/{guild_id}/emojis/{emoji_id}'),
+    )
+)
+
+_MAJOR_PARAMETERS = ('guild_id', 'channel_id', 'webhook_id')
+
+# the smallest valid png, served for widget images
+_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082'
+)
+
+
+@dataclass
+class BucketLimit:
+    limit: int = 5
+    """
+    The number of requests allowed to the bucket per window.
+    """
+
+    per: float = 1.0
+    """
+    The length of the bucket's window in seconds.
+    """
+
+    routes: tuple[str, ...] = ()
+    """
+    Routes sharing the bucket, as ``'METHOD /template'``.
+    """
+
+    shared_limit: int | None = None
+    """
+    If set, requests above this many per window to a resource are refused with a ``shared``
+    scope 429, which isn't counted against the bucket, like Discord does for some resources.
+    """
+
+
+@dataclass
+class _Window:
+    remaining: int
+    reset_at: float
+
+
+@dataclass
+class _Stats:
+    requests: int = 0
+    statuses: Counter[int] = field(default_factory=Counter)
+    ratelimited: Counter[str] = field(default_factory=Counter)
+
+
+class FakeDiscord:
+    """
+    A fake Discord REST API served by aiohttp.
+
+    Parameters:
+        host: The host to listen on.
+        port: The port to listen on, 0 to pick a free one.
+        version: The API version served under ``/api/v{version}``.
+        global_rate: The number of requests allowed per second across every route.
+        buckets: Ratelimits of buckets, by bucket hash. Routes not named by any of
+                 them get a bucket of their own with ``default_limit``.
+        default_limit: The ratelimit of routes without a bucket in ``buckets``.
+        latency: Seconds to wait before answering each request.
+        jitter: Up to how many seconds are randomly added to ``latency``.
+        member_count: How many members and bans each guild pretends to have.
+        shard_count: The shard count recommended by ``/gateway/bot``.
+        max_concurrency: The ``max_concurrency`` given by ``/gateway/bot``.
+    """
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        *,
+        version: int = 10,
+        global_rate: int = 50,
+        buckets: dict[str, BucketLimit] | None = None,
+        default_limit: BucketLimit | None = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        member_count: int = 1000,
+        shard_count: int = 1,
+        max_concurrency: int = 1,
+    ):
+        self.host = host
+        self.port = port
+        self.version = version
+        self.global_rate = global_rate
+        self.default_limit = default_limit or BucketLimit()
+        self.latency = latency
+        self.jitter = jitter
+        self.member_count = member_count
+        self.shard_count = shard_count
+        self.max_concurrency = max_concurrency
+
+        self._limits: dict[str, BucketLimit] = {}
+        self._hashes: dict[str, str] = {}
+        for bucket_hash, limit in (buckets or {}).items():
+            self._limits[bucket_hash] = limit
+            for route in limit.routes:
+                self._hashes[route] = bucket_hash
+        for method, template in ROUTES:
+            route = f'{method} {template}'
+            if route not in self._hashes:
+                bucket_hash = hashlib.sha1(route.encode('utf-8')).hexdigest()[:16]
+                self._hashes[route] = bucket_hash
+                self._limits[bucket_hash] = self.default_limit
+
+        self._windows: dict[str, _Window] = {}
+        self._shared: dict[str, _Window] = {}
+        self._global_tokens: float = global_rate
+        self._global_last = time.monotonic()
+        self.stats = _Stats()
+        self._runner: web.AppRunner | None = None
+        self._message_id = 0
+
+    @property
+    def url(self) -> str:
+        """The base url to point :attr:`HTTPClient.url <trak.internal.http.HTTPClient.url>` at."""
+        return f'http://{self.host}:{self.port}/api/v{self.version}'
+
+    async def start(self) -> None:
+        # large enough for images and attachments
+        app = web.Application(client_max_size=2**25)
+        prefix = f'/api/v{self.version}'
+        for method, template in ROUTES:
+            app.router.add_route(method, prefix + template, self._make_handler(method, template))
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = self._runner.addresses[0][1]
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> 'FakeDiscord':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
+
+    def reset(self) -> None:
+        """Forgets every ratelimit window and zeroes the stats."""
+        self._windows.clear()
+        self._shared.clear()
+        self._global_tokens = self.global_rate
+        self._global_last = time.monotonic()
+        self.stats = _Stats()
+
+    def _make_handler(self, method: str, template: str):
+        route = f'{method} {template}'
+        bucket_hash = self._hashes[route]
+        limit = self._limits[bucket_hash]
+
+        async def handler(request: web.Request) -> web.StreamResponse:
+            self.stats.requests += 1
+            if self.latency or self.jitter:
+                await asyncio.sleep(self.latency + random.random() * self.jitter)
+
+            response = self._ratelimit(request, bucket_hash, limit)
+            if response is None:
+                response = await self._respond(request, method, template)
+            self.stats.statuses[response.status] += 1
+            return response
+
+        return handler
+
+    def _ratelimit(self, request: web.Request, bucket_hash: str, limit: BucketLimit) -> web.Response | None:
+        now = time.monotonic()
+
+        # a token bucket refilling global_rate tokens a second
+        self._global_tokens = min(self.global_rate, self._global_tokens + (now - self._global_last) * self.global_rate)
+        self._global_last = now
+        if self._global_tokens < 1:
+            retry_after = (1 - self._global_tokens) / self.global_rate
+            return self._too_many(
+                'global', retry_after, {'X-RateLimit-Global': 'true', 'X-RateLimit-Scope': 'global'}, is_global=True
+            )
+        self._global_tokens -= 1
+
+        major = ':'.join(request.match_info.get(p, '') for p in _MAJOR_PARAMETERS)
+        window = self._windows.get(f'{bucket_hash}:{major}')
+        if window is None or window.reset_at <= now:
+            window = self._windows[f'{bucket_hash}:{major}'] = _Window(limit.limit, now + limit.per)
+
+        reset_after = window.reset_at - now
+        if window.remaining <= 0:
+            headers = self._bucket_headers(bucket_hash, limit, window, reset_after)
+            headers['X-RateLimit-Scope'] = 'user'
+            return self._too_many('user', reset_after, headers)
+        window.remaining -= 1
+        headers = self._bucket_headers(bucket_hash, limit, window, reset_after)
+
+        if limit.shared_limit is not None:
+            shared = self._shared.get(request.path)
+            if shared is None or shared.reset_at <= now:
+                shared = self._shared[request.path] = _Window(limit.shared_limit, now + limit.per)
+            if shared.remaining <= 0:
+                # not counted against the bucket
+                window.remaining += 1
+                headers = self._bucket_headers(bucket_hash, limit, window, reset_after)
+                headers['X-RateLimit-Scope'] = 'shared'
+                return self._too_many('shared', shared.reset_at - now, headers)
+            shared.remaining -= 1
+
+        request['ratelimit_headers'] = headers
+        return None
+
+    @staticmethod
+    def _bucket_headers(bucket_hash: str, limit: BucketLimit, window: _Window, reset_after: float) -> dict[str, str]:
+        return {
+            'X-RateLimit-Limit': str(limit.limit),
+            'X-RateLimit-Remaining': str(window.remaining),
+            'X-RateLimit-Reset': f'{time.time() + reset_after:.3f}',
+            'X-RateLimit-Reset-After': f'{reset_after:.3f}',
+            'X-RateLimit-Bucket': bucket_hash,
+        }
+
+    def _too_many(
+        self, scope: str, retry_after: float, headers: dict[str, str], is_global: bool = False
+    ) -> web.Response:
+        self.stats.ratelimited[scope] += 1
+        headers['Retry-After'] = f'{retry_after:.3f}'
+        body = {'message': 'You are being rate limited.', 'retry_after': retry_after, 'global': is_global}
+        return web.Response(status=429, text=utils.dumps(body), content_type='application/json', headers=headers)
+
+    async def _respond(self, request: web.Request, method: str, template: str) -> web.Response:
+        headers = request['ratelimit_headers']
+        if (method, template) in _NO_CONTENT:
+            return web.Response(status=204, headers=headers)
+        if template.endswith('widget.png'):
+            return web.Response(body=_PNG, content_type='image/png', headers=headers)
+
+        payload: Any = None
+        if request.can_read_body:
+            payload = await request.read()
+            if request.content_type == 'application/json':
+                payload = utils.loads(payload)
+            else:
+                payload = None
+
+        body = self._body(request, method, template, payload)
+        return web.Response(text=utils.dumps(body), content_type='application/json', headers=headers)
+
+    def _body(self, request: web.Request, method: str, template: str, payload: dict[str, Any] | None) -> Any:
+        info = dict(request.match_info)
+        guild_id = info.get('guild_id', '1')
+
+        if template in ('/guilds/{guild_id}/members', '/guilds/{guild_id}/bans'):
+            after = int(request.query.get('after', 0))
+            limit = int(request.query.get('limit', 1))
+            ids = range(after + 1, min(after + limit, self.member_count) + 1)
+            if template.endswith('bans'):
+                return [{'reason': None, 'user': _user(i)} for i in ids]
+            return [_member(i) for i in ids]
+
+        listings = ('/channels', '/roles', '/emojis', '/regions', '/invites', '/integrations')
+        if method == 'GET' and template.endswith(listings):
+            return []
+        if template == '/guilds/{guild_id}/members/search':
+            return [_member(i) for i in range(1, min(int(request.query.get('limit', 1)), self.member_count) + 1)]
+        if template == '/guilds/{guild_id}/threads/active':
+            return {'threads': [], 'members': []}
+        if template == '/guilds/{guild_id}/prune':
+            return {'pruned': 0}
+        if template == '/guilds/{guild_id}/mfa':
+            return {'level': (payload or {}).get('level', 0)}
+        if template == '/gateway/bot':
+            return {
+                'url': 'wss://gateway.discord.gg',
+                'shards': self.shard_count,
+                'session_start_limit': {
+                    'total': 1000,
+                    'remaining': 1000,
+                    'reset_after': 86400000,
+                    'max_concurrency': self.max_concurrency,
+                },
+            }
+        if template == '/gateway':
+            return {'url': 'wss://gateway.discord.gg'}
+        if template == '/users/@me':
+            return {**_user(1), 'bot': True, **(payload or {})}
+        if template == '/guilds/{guild_id}/bans/{user_id}':
+            return {'reason': None, 'user': _user(int(info['user_id']))}
+        if '{user_id}' in template or template.endswith('/@me'):
+            return _member(int(info.get('user_id', 1)))
+
+        if template.endswith(('/messages', '{webhook_token}')):
+            self._message_id += 1
+            channel_id = info.get('channel_id', info.get('webhook_id'))
+            return {'id': str(self._message_id), 'channel_id': channel_id, **(payload or {})}
+
+        # everything else echoes what was sent onto an object with the requested id
+        resource_id = next((v for k, v in info.items() if k != 'guild_id'), guild_id)
+        return {'id': resource_id, 'guild_id': guild_id, **(payload or {})}
+
+
+def _user(id: int) -> dict[str, Any]:
+    return {'id': str(id), 'username': f'user{id}', 'discriminator': '0000', 'avatar': None}
+
+
+def _member(id: int) -> dict[str, Any]:
+    return {'user': _user(id), 'roles': [], 'joined_at': '2022-01-01T00:00:00+00:00', 'deaf': False, 'mute': False}
@@ -0,0 +1,204 @@
+# Copyright (c) 2021-2022 VincentRPS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Benchmarks decompressing and parsing a Gateway connection.
+
+    poetry run python benchmarks/gateway.py --events 20000 --guilds 50
+
+Run it from the repository root with trak installed, or with ``PYTHONPATH=.`` in place of ``poetry run``.
+
+Replays a recorded-like stream of GUILD_CREATEs followed by smaller events through
+each transport compression and encoding, and the per-message path Shard used before
+ZlibStream, reporting the bytes received and CPU time per event for each.
+zstd-stream is skipped if zstandard isn't installed.
+"""
+import argparse
+import logging
+import random
+import time
+import zlib
+from typing import Any, Callable
+
+from trak import utils
+from trak.internal.gateway import etf
+from trak.internal.gateway.compression import HAS_ZSTD, ZLIB_SUFFIX, Compression, get_compression
+
+if HAS_ZSTD:
+    import zstandard
+
+_log = logging.getLogger('trak.internal.gateway.shard')
+
+
+def _guild(i: int, members: int) -> dict[str, Any]:
+    return {
+        'id': str(10**17 + i),
+        'name': f'guild {i}',
+        'member_count': members,
+        'roles': [{'id': str(10**17 + r), 'name': f'role {r}', 'permissions': '0', 'color': r} for r in range(30)],
+        'channels': [{'id': str(10**17 + c), 'name': f'channel-{c}', 'type': 0, 'position': c} for c in range(40)],
+        'members': [
+            {
+                'user': {'id': str(10**17 + m), 'username': f'member {m}', 'discriminator': f'{m % 10000:04}'},
+                'roles': [str(10**17 + m % 30)],
+                'joined_at': '2022-01-01T00:00:00+00:00',
+            }
+            for m in range(members)
+        ],
+    }
+
+
+def _message(i: int) -> dict[str, Any]:
+    return {
+        'id': str(10**17 + i),
+        'channel_id': str(10**17 + i % 40),
+        'author': {'id': str(10**17 + i % 500), 'username': f'member {i % 500}'},
+        'content': 'hello ' * random.randint(1, 40),
+        'timestamp': '2022-01-01T00:00:00+00:00',
+    }
+
+
+def _as_etf(obj: Any, key: str = '') -> Any:
+    # Discord sends snowflakes as integers over etf
+    if isinstance(obj, dict):
+        return {k: _as_etf(v, k) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_as_etf(v, key) for v in obj]
+    if isinstance(obj, str) and (key == 'id' or key.endswith('_id') or key == 'roles'):
+        return int(obj)
+    return obj
+
+
+def _compressor(compression: Compression, split: int) -> Callable[[bytes], list[bytes]]:
+    if compression == 'zlib-stream':
+        deflate = zlib.compressobj()
+
+        def compress(data: bytes) -> list[bytes]:
+            data = deflate.compress(data) + deflate.flush(zlib.Z_SYNC_FLUSH)
+            assert data.endswith(ZLIB_SUFFIX)
+            # Discord splits large payloads over several messages
+            return [data[i : i + split] for i in range(0, len(data), split)]
+
+    elif compression == 'zstd-stream':
+        stream = zstandard.ZstdCompressor().compressobj()
+
+        def compress(data: bytes) -> list[bytes]:
+            return [stream.compress(data) + stream.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)]
+
+    else:
+
+        def compress(data: bytes) -> list[bytes]:
+            return [data]
+
+    return compress
+
+
+def _stream(events: int, guilds: int, members: int, split: int, encoding: str, compression: Compression) -> list[bytes]:
+    compress = _compressor(compression, split)
+    messages = []
+    payloads = [{'op': 0, 's': i, 't': 'GUILD_CREATE', 'd': _guild(i, members)} for i in range(guilds)]
+    payloads += [{'op': 0, 's': i, 't': 'MESSAGE_CREATE', 'd': _message(i)} for i in range(guilds, events)]
+    for payload in payloads:
+        encoded = etf.dumps(_as_etf(payload)) if encoding == 'etf' else utils.dumps(payload).encode('utf-8')
+        messages.extend(compress(encoded))
+    return messages
+
+
+def _previous() -> Callable[[bytes], Any]:
+    # Shard.receive before ZlibStream, except that it dropped split payloads instead of buffering them
+    buf = bytearray()
+    inf = zlib.decompressobj()
+
+    def feed(data: bytes) -> Any:
+        nonlocal buf
+        buf.extend(data)
+        if len(data) < 4 or data[-4:] != ZLIB_SUFFIX:
+            return None
+        encoded = inf.decompress(buf).decode('utf-8')
+        buf = bytearray()
+        data = utils.loads(encoded)
+        _log.debug(f'shard:0:< {encoded}')
+        return data
+
+    return feed
+
+
+def _current(compression: Compression, loads: Callable[[bytes], Any]) -> Callable[[], Callable[[bytes], Any]]:
+    def factory() -> Callable[[bytes], Any]:
+        stream = get_compression(compression)
+
+        def feed(data: bytes) -> Any:
+            payload = stream.feed(data)
+            return None if payload is None else loads(payload)
+
+        return feed
+
+    return factory
+
+
+def run(messages: list[bytes], feed: Callable[[bytes], Any], rounds: int) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        parse = feed()  # type: ignore
+        started = time.process_time()
+        for message in messages:
+            parse(message)
+        best = min(best, time.process_time() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--guilds', type=int, default=50, help='GUILD_CREATEs at the start of the stream')
+    parser.add_argument('--members', type=int, default=250, help='members in each GUILD_CREATE')
+    parser.add_argument('--split', type=int, default=2**16, help='the most bytes Discord sends in one message')
+    parser.add_argument('--rounds', type=int, default=5, help='runs to take the best of')
+    args = parser.parse_args()
+
+    print(f'{args.events} events, orjson {utils.HAS_ORJSON}')
+    cases: list[tuple[str, str, Compression, Callable[[], Callable[[bytes], Any]]]] = [
+        ('previous', 'json', 'zlib-stream', _previous)
+    ]
+    compressions: list[Compression] = ['zlib-stream', 'zstd-stream', 'none']
+    if not HAS_ZSTD:
+        compressions.remove('zstd-stream')
+    for compression in compressions:
+        cases.append((compression, 'json', compression, _current(compression, utils.loads)))
+        cases.append((compression, 'etf', compression, _current(compression, etf.loads)))
+
+    print(f'{"":>11} {"":>4} {"messages":>8} {"MiB":>6} {"bytes/event":>11} {"CPU/event":>10} {"events/s":>10}')
+    streams: dict[tuple[str, str], list[bytes]] = {}
+    for name, encoding, compression, feed in cases:
+        if (encoding, compression) not in streams:
+            random.seed(0)
+            streams[encoding, compression] = _stream(
+                args.events, args.guilds, args.members, args.split, encoding, compression
+            )
+        messages = streams[encoding, compression]
+        size = sum(map(len, messages))
+        elapsed = run(messages, feed, args.rounds)
+        print(
+            f'{name:>11} {encoding:>4} {len(messages):>8} {size / 2**20:>6.2f} {size / args.events:>11.0f}'
+            f' {elapsed / args.events * 1e6:>8.2f}us {args.events / elapsed:>10,.0f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+# Copyright (c) 2021-2022 VincentRPS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Benchmarks HTTPClient against a local FakeDiscord server.
+
+    poetry run python benchmarks/rest.py --scenario mixed --requests 2000 --concurrency 200
+
+Run it from the repository root with trak installed, or with ``PYTHONPATH=.`` in place of ``poetry run``.
+
+Reports throughput, how many requests were refused with a 429 and the latency
+of whole requests, ratelimit waits and retries included.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from typing import Any, Awaitable, Callable
+
+from fake import BucketLimit, FakeDiscord
+
+from trak.internal.blocks import AdaptiveConcurrency, GlobalRatelimiter
+from trak.internal.http import HTTPClient, PoolSettings
+from trak.internal.http.route import Route
+
+Call = Callable[[HTTPClient, int], Awaitable[Any]]
+
+
+def _hot(http: HTTPClient, i: int) -> Awaitable[Any]:
+    # one bucket, one guild
+    return http.get_guild_member(1, i)
+
+
+def _spread(http: HTTPClient, i: int) -> Awaitable[Any]:
+    # one bucket per guild, held back by the global ratelimit
+    return http.get_guild_member(i % 100, i)
+
+
+_MIXED: list[Call] = [
+    lambda http, i: http.get_guild(i % 20),
+    lambda http, i: http.get_guild_member(i % 20, i),
+    lambda http, i: http.list_guild_members(i % 20, limit=100),
+    lambda http, i: http.get_guild_roles(i % 20),
+    lambda http, i: http.add_guild_member_role(i % 20, i, 1),
+    lambda http, i: http.modify_guild_member(i % 20, i, nick=f'member {i}'),
+    lambda http, i: http.list_guild_emojis(i % 20),
+    lambda http, i: http.get_guild_ban(i % 20, i),
+]
+
+
+def _mixed(http: HTTPClient, i: int) -> Awaitable[Any]:
+    return random.choice(_MIXED)(http, i)
+
+
+# an announcement sent to many channels, one request per channel
+ANNOUNCEMENT = {
+    'content': 'Scheduled maintenance starts in one hour. ' * 20,
+    'embeds': [{'title': 'Maintenance', 'fields': [{'name': str(i), 'value': 'x' * 100} for i in range(20)]}],
+}
+
+
+def _announce(http: HTTPClient, i: int) -> Awaitable[Any]:
+    return http.request('POST', Route('/channels/{channel_id}/messages', channel_id=i), ANNOUNCEMENT)
+
+
+def _broadcast(http: HTTPClient, i: int) -> Awaitable[Any]:
+    # the same announcement, serialized once
+    prepared = getattr(http, '_benchmark_prepared', None)
+    if prepared is None:
+        prepared = http.prepare('POST', '/channels/{channel_id}/messages', ANNOUNCEMENT)
+        http._benchmark_prepared = prepared  # type: ignore
+    return http.send_prepared(prepared, i)
+
+
+SCENARIOS: dict[str, Call] = {
+    'hot': _hot,
+    'spread': _spread,
+    'mixed': _mixed,
+    'announce': _announce,
+    'broadcast': _broadcast,
+}
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    server = FakeDiscord(
+        global_rate=args.global_rate,
+        default_limit=BucketLimit(args.limit, args.per),
+        latency=args.latency,
+        jitter=args.jitter,
+    )
+    await server.start()
+
+    http = HTTPClient(
+        'benchmark',
+        10,
+        global_ratelimiter=GlobalRatelimiter(args.global_rate),
+        pool=PoolSettings(limit=args.pool_limit),
+        concurrency=AdaptiveConcurrency(max_limit=args.pool_limit) if args.adaptive else None,
+    )
+    http.url = server.url
+    await http.warm_up(args.warm)
+
+    call = SCENARIOS[args.scenario]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: list[float] = []
+    failures = 0
+
+    async def one(i: int) -> None:
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(http, i)
+            except Exception:
+                failures += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    cpu = time.process_time()
+    await asyncio.gather(*(one(i) for i in range(1, args.requests + 1)))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+
+    await http._session.close()  # type: ignore
+    await server.close()
+
+    latencies.sort()
+    ratelimited = sum(server.stats.ratelimited.values())
+    return {
+        'elapsed': elapsed,
+        'cpu': cpu,
+        'throughput': len(latencies) / elapsed,
+        'completed': len(latencies),
+        'failed': failures,
+        'concurrency_limit': http.concurrency.limit if http.concurrency is not None else None,
+        'sent': server.stats.requests,
+        'ratelimited': dict(server.stats.ratelimited),
+        '429_rate': ratelimited / server.stats.requests if server.stats.requests else 0.0,
+        'p50': _percentile(latencies, 0.5),
+        'p90': _percentile(latencies, 0.9),
+        'p99': _percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else 0.0,
+        'mean': statistics.fmean(latencies) if latencies else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=SCENARIOS, default='mixed')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=100, help='requests the benchmark makes at once')
+    parser.add_argument('--global-rate', type=int, default=50, help='global requests per second the server allows')
+    parser.add_argument('--limit', type=int, default=5, help='requests per bucket window the server allows')
+    parser.add_argument('--per', type=float, default=1.0, help='length of a bucket window in seconds')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the server takes to answer')
+    parser.add_argument('--jitter', type=float, default=0.02, help='random seconds added to the latency')
+    parser.add_argument('--pool-limit', type=int, default=100, help='connections the client may open')
+    parser.add_argument('--warm', type=int, default=0, help='connections opened before starting')
+    parser.add_argument('--adaptive', action='store_true', help='bound requests in flight with AdaptiveConcurrency')
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(
+        f"{result['completed']} requests in {result['elapsed']:.2f}s ({result['throughput']:.1f}/s), "
+        f"{result['failed']} failed"
+    )
+    print(f"{result['cpu']:.2f}s of CPU time, client and server together")
+    if result['concurrency_limit'] is not None:
+        print(f"concurrency limit settled at {result['concurrency_limit']}")
+    print(f"{result['sent']} sent, 429 rate {result['429_rate']:.2%} {result['ratelimited']}")
+    print(
+        'latency'
+        f" mean {result['mean'] * 1000:.1f}ms"
+        f" p50 {result['p50'] * 1000:.1f}ms"
+        f" p90 {result['p90'] * 1000:.1f}ms"
+        f" p99 {result['p99'] * 1000:.1f}ms"
+        f" max {result['max'] * 1000:.1f}ms"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import asyncio
+import io
+import unittest
+
+from trak.file import File
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self.body = bytearray()
+
+    async def write(self, chunk: bytes) -> None:
+        self.body += chunk
+
+
+async def _send(file: File) -> bytes:
+    writer = _Writer()
+    await file.to_payload().write(writer)  # type: ignore
+    return bytes(writer.body)
+
+
+class FileTest(unittest.TestCase):
+    def test_bytesio_usable_after_close(self) -> None:
+        with io.BytesIO(b'abcdef') as buffer:
+            buffer.seek(2)
+            file = File(buffer, 'a.bin')
+            self.assertEqual(asyncio.run(_send(file)), b'cdef')
+            file.close()
+
+            buffer.seek(0, io.SEEK_END)
+            buffer.write(b'gh')
+        self.assertTrue(buffer.closed)
+
+    def test_bytearray_usable_after_close(self) -> None:
+        data = bytearray(b'abc')
+        file = File(data, 'a.bin')
+        file.close()
+        data.extend(b'd')
+
+        # sending again views the buffer as it is now
+        self.assertEqual(asyncio.run(_send(file)), b'abcd')
+        file.close()
+        data.clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
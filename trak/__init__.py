@@ -18,6 +18,7 @@ del colorama
 from .app import *
 from .assets import *
 from .file import *
+from .image import *
 from .state import *
 from .user import *
 from .utils import *
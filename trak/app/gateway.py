@@ -22,25 +22,69 @@ import asyncio
 import logging
 
 from trak.app.rest import RESTApp
-from trak.internal.gateway import ShardManager
+from trak.internal.gateway import ClusterIPC, Compression, Encoding, IdentifyRatelimiter, ShardManager
+from trak.internal.http import PoolSettings
 
 
 class GatewayApp(RESTApp):
     def __init__(
-        self, intents: int, *, shards: int = 1, version: int = 10, level: int = logging.INFO, cache_timeout: int = 10000
+        self,
+        intents: int,
+        *,
+        shards: int | None = 1,
+        reshard_interval: float | None = None,
+        encoding: Encoding = 'json',
+        compression: Compression = 'zlib-stream',
+        version: int = 10,
+        level: int = logging.INFO,
+        cache_timeout: int = 10000,
+        pool: PoolSettings | None = None,
+        ratelimit_coordinator: str | None = None,
     ) -> None:
         self.intents = intents
+        # None lets Discord pick the count, rechecked every reshard_interval seconds if set
         self.shards = shards
-        super().__init__(version=version, level=level, cache_timeout=cache_timeout)
+        self.reshard_interval = reshard_interval
+        # etf payloads are smaller than json, decoding them is pure Python though
+        self.encoding = encoding
+        self.compression = compression
+        # set when running as one process of a ShardCluster
+        self.ipc: ClusterIPC | None = None
+        super().__init__(
+            version=version,
+            level=level,
+            cache_timeout=cache_timeout,
+            pool=pool,
+            ratelimit_coordinator=ratelimit_coordinator,
+        )
+
+    async def start_shards(
+        self,
+        token: str,
+        *,
+        shard_ids: list[int] | None = None,
+        identify_ratelimiter: IdentifyRatelimiter | None = None,
+    ) -> None:
+        await self.start(token=token)
+        self._state.gateway_enabled = True
+
+        self.shard_manager = ShardManager(
+            self.shards,
+            self._state,
+            self.dispatcher,
+            self._version,
+            encoding=self.encoding,
+            compression=self.compression,
+            reshard_interval=self.reshard_interval,
+            shard_ids=shard_ids,
+            identify_ratelimiter=identify_ratelimiter,
+        )
+        # .run/.start already sets token to a non-None type.
+        await self.shard_manager.connect(self.token)  # type: ignore
 
     def connect(self, token: str):
         async def _conn():
-            await self.start(token=token)
-            self._state.gateway_enabled = True
-
-            self.shard_manager = ShardManager(self.shards, self._state, self.dispatcher, self._version)
-            # .run/.start already sets token to a non-None type.
-            await self.shard_manager.connect(self.token)  # type: ignore
+            await self.start_shards(token)
 
         # TODO: Replace with asyncio.run
         loop = asyncio.new_event_loop()
@@ -48,5 +92,6 @@ class GatewayApp(RESTApp):
         loop.run_forever()
 
     async def close(self):
-        await super().close()
+        # the websockets go with the HTTP session, close them first
         await self.shard_manager.disconnect()
+        await super().close()
@@ -23,8 +23,10 @@ import logging
 from typing import Any, Callable, Coroutine, Type, TypedDict
 
 from trak.guild import BaseEmoji, BaseGuild, BaseRole, Emoji, Guild, Role
-from trak.internal import EventDispatcher, HTTPClient, start_logging
+from trak.image import ImageSource
+from trak.internal import EventDispatcher, HTTPClient, PoolSettings, start_logging
 from trak.internal.events import BaseEventDispatcher
+from trak.internal.http.coordinator import CoordinatorClient
 from trak.state import BaseConnectionState, ConnectionState
 from trak.user import BaseCurrentUser, BaseUser, CurrentUser, User
 
@@ -54,7 +56,15 @@ class BaseRESTApp:
     dispatcher: BaseEventDispatcher
     models: Models
 
-    def __init__(self, *, version: int = 10, level: int = logging.INFO, cache_timeout: int = 10000) -> None:
+    def __init__(
+        self,
+        *,
+        version: int = 10,
+        level: int = logging.INFO,
+        cache_timeout: int = 10000,
+        pool: PoolSettings | None = None,
+        ratelimit_coordinator: str | None = None,
+    ) -> None:
         pass
 
     async def start(self, token: str) -> None:
@@ -63,7 +73,7 @@ class BaseRESTApp:
     async def close(self) -> None:
         pass
 
-    async def edit(self, username: str | None = None, avatar: bytes | None = None):
+    async def edit(self, username: str | None = None, avatar: ImageSource | None = None):
         pass
 
     @property
@@ -75,9 +85,20 @@ class BaseRESTApp:
 
 
 class RESTApp(BaseRESTApp):
-    def __init__(self, *, version: int = 10, level: int = logging.INFO, cache_timeout: int = 10000) -> None:
+    def __init__(
+        self,
+        *,
+        version: int = 10,
+        level: int = logging.INFO,
+        cache_timeout: int = 10000,
+        pool: PoolSettings | None = None,
+        ratelimit_coordinator: str | None = None,
+    ) -> None:
         self.token: str | None = None
         self.cache_timeout = cache_timeout
+        self.pool = pool
+        # unix socket path of a RatelimitCoordinator shared with other processes
+        self.ratelimit_coordinator = ratelimit_coordinator
         self._version = version
         self._level = level
 
@@ -98,15 +119,19 @@ class RESTApp(BaseRESTApp):
         self._state = self.models['state'](self, self.cache_timeout)
         await self._state.start_cache()
 
-        self.http = HTTPClient(self.token, self._version)
+        coordinator = CoordinatorClient(self.ratelimit_coordinator) if self.ratelimit_coordinator else None
+        self.http = HTTPClient(self.token, self._version, pool=self.pool, coordinator=coordinator)
+        await self.http.warm_up()
         user_data = await self.http.get_me()
         self.user = self.models['current_user'](user_data, self._state)
         self.dispatcher.dispatch('hook')
 
     async def close(self) -> None:
+        if self.http.coordinator is not None:
+            await self.http.coordinator.close()
         await self.http._session.close()
 
-    async def edit(self, username: str | None = None, avatar: bytes | None = None) -> None:
+    async def edit(self, username: str | None = None, avatar: ImageSource | None = None) -> None:
         return await self.user.edit(username=username, avatar=avatar)
 
     @property
@@ -18,22 +18,77 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
 import io
+import mmap
 import os
 from typing import Protocol
 
+from aiohttp import Payload
+from aiohttp.abc import AbstractStreamWriter
+
+__all__ = ('BaseFile', 'File')
+
+CHUNK_SIZE = 2**16
+
+
+class _BufferPayload(Payload):
+    """Streams an in-memory buffer in chunks, slicing the view instead of copying it."""
+
+    _value: memoryview
+    # nothing is consumed by writing, so the same payload can be sent again on retries
+    _autoclose = True
+
+    def __init__(self, value: memoryview, **kwargs) -> None:
+        kwargs.setdefault('content_type', 'application/octet-stream')
+        super().__init__(value, **kwargs)
+        self._size = value.nbytes
+
+    def decode(self, encoding: str = 'utf-8', errors: str = 'strict') -> str:
+        return str(self._value, encoding, errors)
+
+    async def write(self, writer: AbstractStreamWriter) -> None:
+        view = self._value
+        for offset in range(0, view.nbytes, CHUNK_SIZE):
+            await writer.write(view[offset : offset + CHUNK_SIZE])  # type: ignore
+
+
+class _StreamPayload(Payload):
+    """Streams a file object from its original position, reading off the event loop."""
+
+    _value: io.BufferedIOBase
+    # the file object belongs to the File, which closes it once the request is done
+    _autoclose = False
+
+    def __init__(self, value: io.BufferedIOBase, position: int, **kwargs) -> None:
+        kwargs.setdefault('content_type', 'application/octet-stream')
+        super().__init__(value, **kwargs)
+        self._position = position
+        self._size = value.seek(0, io.SEEK_END) - position
+        value.seek(position)
+
+    def decode(self, encoding: str = 'utf-8', errors: str = 'strict') -> str:
+        self._value.seek(self._position)
+        return self._value.read().decode(encoding, errors)
+
+    async def write(self, writer: AbstractStreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        # always rewind first, so retries send the same body
+        await loop.run_in_executor(None, self._value.seek, self._position)
+        while chunk := await loop.run_in_executor(None, self._value.read, CHUNK_SIZE):
+            await writer.write(chunk)
+
 
-# TODO: For some reason, this is apparently really slow
-# so we need to speed it up.
 class BaseFile(Protocol):
-    fp: io.BufferedIOBase
+    fp: io.BufferedIOBase | None
+    data: memoryview | None
     filename: str | None
     description: str | None
     spoiler: bool
 
     def __init__(
         self,
-        fp: str | bytes | os.PathLike | io.BufferedIOBase,
+        fp: str | os.PathLike | bytes | bytearray | memoryview | mmap.mmap | io.BufferedIOBase,
         filename: str | None = None,
         *,
         description: str | None = None,
@@ -41,6 +96,9 @@ class BaseFile(Protocol):
     ) -> None:
         pass
 
+    def to_payload(self) -> Payload:
+        pass
+
     def reset(self, seek: bool = False) -> None:
         pass
 
@@ -49,30 +107,66 @@ class BaseFile(Protocol):
 
 
 class File(BaseFile):
+    """Represents a file to upload.
+
+    In-memory sources ([bytes][], [bytearray][], [memoryview][], [mmap.mmap][] and [io.BytesIO][])
+    are sent straight from their buffer without being copied, and paths are memory-mapped.
+    Other file objects are streamed in chunks from their current position.
+
+    Files are closed once the request sending them is done, which releases the File's view of an
+    in-memory source so the caller can resize or close it again. The view is taken again if the File
+    is sent after that, while paths and file objects opened by the File can't be reused.
+
+    Parameters:
+        fp: A path, the file's contents, or a seekable and readable file object.
+        filename: The name of the file, taken from ``fp`` if possible.
+        description: The description of the attachment.
+        spoiler: Whether the file should be marked as a spoiler.
+    """
+
     def __init__(
         self,
-        fp: str | bytes | os.PathLike | io.BufferedIOBase,
+        fp: str | os.PathLike | bytes | bytearray | memoryview | mmap.mmap | io.BufferedIOBase,
         filename: str | None = None,
         *,
         description: str | None = None,
         spoiler: bool = False,
     ) -> None:
-        if isinstance(fp, io.IOBase):
+        self.fp = None
+        self.data = None
+        self._mmap: mmap.mmap | None = None
+        # the caller's in-memory source, viewed again if the File is sent after being closed
+        self._source: bytes | bytearray | memoryview | mmap.mmap | io.BytesIO | None = None
+        self._original_pos = 0
+        self._owner = False
+
+        if isinstance(fp, (bytes, bytearray, memoryview, mmap.mmap, io.BytesIO)):
+            self._source = fp
+            if isinstance(fp, io.BytesIO):
+                self._original_pos = fp.tell()
+            self.data = self._view()
+        elif isinstance(fp, io.IOBase):
             if not (fp.seekable() and fp.readable()):
                 raise ValueError(f"File buffer {fp!r} must be seekable and readable")
             self.fp = fp
             self._original_pos = fp.tell()
-            self._owner = False
         else:
             self.fp = open(fp, "rb")
-            self._original_pos = 0
             self._owner = True
+            try:
+                self._mmap = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # empty and special files can't be mapped, stream them instead
+                pass
+            else:
+                self.data = memoryview(self._mmap)
 
         if filename is None:
-            if isinstance(fp, str):
-                _, filename = os.path.split(fp)
+            if isinstance(fp, (str, os.PathLike)):
+                filename = os.path.basename(os.fspath(fp))
             else:
-                filename = getattr(fp, "name", None)
+                name = getattr(fp, "name", None)
+                filename = os.path.basename(name) if isinstance(name, str) else "untitled"
 
         self.spoiler = spoiler
         self.filename = filename
@@ -82,18 +176,39 @@ class File(BaseFile):
             self.filename = f"SPOILER_{filename}"
 
         self.description = description
-        self._close = self.fp.close
-        self.fp.close = lambda: None
+
+    def _view(self) -> memoryview | None:
+        if self.data is None and self._source is not None:
+            source = self._source
+            if isinstance(source, io.BytesIO):
+                self.data = source.getbuffer()[self._original_pos :]
+            else:
+                self.data = memoryview(source).cast('B')
+        return self.data
+
+    def to_payload(self) -> Payload:
+        data = self._view()
+        if data is not None:
+            return _BufferPayload(data)
+        return _StreamPayload(self.fp, self._original_pos)  # type: ignore
 
     def reset(self, seek=True) -> None:
-        # seek to initial position on failed requests
-        # on the first try, `seek` will be 0, so the file
-        # doesn't get reset
-        if seek:
+        # payloads rewind themselves before every write, this is kept for
+        # code which reads from `fp` directly
+        if seek and self.fp is not None and self.data is None:
             self.fp.seek(self._original_pos)
 
     def close(self) -> None:
+        # an export left on a bytearray or BytesIO stops the caller resizing or closing it
+        if self.data is not None:
+            self.data.release()
+            self.data = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # something still holds a view, it'll be unmapped once that's collected
+                pass
         # close stream that we opened
-        self.fp.close = self._close
-        if self._owner:
+        if self._owner and self.fp is not None:
             self.fp.close()
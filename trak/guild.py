@@ -18,10 +18,12 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from typing import Protocol
+from typing import Iterable, Protocol
 
 from discord_typings import EmojiData, GuildData, RoleData, RoleTagsData, Snowflake
 from trak.errors import GuildException
+from trak.image import ImageSource
+from trak.internal.http.bulk import BulkOperation
 
 from trak.mixins import Hashable
 from trak.state import BaseConnectionState
@@ -76,11 +78,11 @@ class BaseGuild(Protocol):
         explicit_content_filter: int | None = ...,
         afk_channel_id: Snowflake | None = ...,
         afk_timeout: int = ...,
-        icon: bytes | None = ...,
+        icon: ImageSource | None = ...,
         owner_id: Snowflake = ...,
-        splash: bytes | None = ...,
-        discovery_splash: bytes | None = ...,
-        banner: bytes | None = ...,
+        splash: ImageSource | None = ...,
+        discovery_splash: ImageSource | None = ...,
+        banner: ImageSource | None = ...,
         system_channel_id: Snowflake | None = ...,
         system_channel_flags: int = ...,
         rules_channel_id: Snowflake | None = ...,
@@ -95,6 +97,16 @@ class BaseGuild(Protocol):
     async def delete(self) -> None:
         ...
 
+    def add_role_to_members(
+        self, role_id: Snowflake, user_ids: Iterable[Snowflake], *, reason: str | None = None, concurrency: int = 10
+    ) -> BulkOperation[Snowflake]:
+        ...
+
+    def remove_role_from_members(
+        self, role_id: Snowflake, user_ids: Iterable[Snowflake], *, reason: str | None = None, concurrency: int = 10
+    ) -> BulkOperation[Snowflake]:
+        ...
+
 
 class Guild(Hashable):
     def __init__(self, data: GuildData, state: BaseConnectionState):
@@ -143,11 +155,11 @@ class Guild(Hashable):
         explicit_content_filter: int | None = ...,
         afk_channel_id: Snowflake | None = ...,
         afk_timeout: int = ...,
-        icon: bytes | None = ...,
+        icon: ImageSource | None = ...,
         owner_id: Snowflake = ...,
-        splash: bytes | None = ...,
-        discovery_splash: bytes | None = ...,
-        banner: bytes | None = ...,
+        splash: ImageSource | None = ...,
+        discovery_splash: ImageSource | None = ...,
+        banner: ImageSource | None = ...,
         system_channel_id: Snowflake | None = ...,
         system_channel_flags: int = ...,
         rules_channel_id: Snowflake | None = ...,
@@ -195,6 +207,30 @@ class Guild(Hashable):
 
         await self._state._app.http.delete_guild(self.id)
 
+    def add_role_to_members(
+        self, role_id: Snowflake, user_ids: Iterable[Snowflake], *, reason: str | None = None, concurrency: int = 10
+    ) -> BulkOperation[Snowflake]:
+        """Adds a role to many members, see [BulkOperation][trak.internal.http.bulk.BulkOperation].
+
+        Returns:
+            An operation which streams a result per member when iterated, and can be resumed.
+        """
+        return self._state._app.http.bulk_add_guild_member_role(
+            self.id, role_id, user_ids, reason=reason, concurrency=concurrency
+        )
+
+    def remove_role_from_members(
+        self, role_id: Snowflake, user_ids: Iterable[Snowflake], *, reason: str | None = None, concurrency: int = 10
+    ) -> BulkOperation[Snowflake]:
+        """Removes a role from many members, see [BulkOperation][trak.internal.http.bulk.BulkOperation].
+
+        Returns:
+            An operation which streams a result per member when iterated, and can be resumed.
+        """
+        return self._state._app.http.bulk_remove_guild_member_role(
+            self.id, role_id, user_ids, reason=reason, concurrency=concurrency
+        )
+
 
 class _RoleTags:
     def __init__(self, data: RoleTagsData | None) -> None:
@@ -0,0 +1,153 @@
+# Copyright (c) 2021-2022 VincentRPS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import asyncio
+import os
+from base64 import b64encode
+from typing import TYPE_CHECKING, Union
+
+from trak.file import File
+from trak.utils import _get_image_mime_type
+
+if TYPE_CHECKING:
+    from trak.mixins import BaseAssetMixin
+
+__all__ = ('Image', 'ImageSource')
+
+# images above this size are encoded in a worker thread
+ENCODE_THREAD_THRESHOLD = 2**16
+# a multiple of 3, so chunks encode without padding and can be joined
+_ENCODE_CHUNK = 3 * 2**16
+
+ImageSource = Union['Image', bytes, bytearray, memoryview, File, 'BaseAssetMixin', str, os.PathLike]
+
+
+def _encode(data: memoryview, mime: str) -> str:
+    # encoded in pieces so a thread doing this hands the GIL back to the event loop between them
+    chunks = [b64encode(data[i : i + _ENCODE_CHUNK]).decode('ascii') for i in range(0, data.nbytes, _ENCODE_CHUNK)]
+    return f'data:{mime};base64,{"".join(chunks)}'
+
+
+def _read_path(path: os.PathLike) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _read_stream(file: File) -> bytes:
+    file.reset()
+    return file.fp.read()  # type: ignore
+
+
+class Image:
+    """Represents an image to send as an avatar, icon, banner, splash or emoji.
+
+    The image is encoded into a data URI the first time it's sent, and reused after that,
+    so keep hold of the same [Image][trak.image.Image] to send it again. Large images are
+    read and encoded in a worker thread rather than on the event loop.
+
+    Parameters:
+        source: The image's contents, a [File][trak.file.File] or [Asset][trak.assets.Asset]
+                to read them from, a path, or an already encoded ``data:`` URI.
+                Strings are only taken as ``data:`` URIs, pass paths as a [pathlib.Path][].
+
+    Raises:
+        ValueError: A string was given which isn't a ``data:`` URI.
+    """
+
+    def __init__(self, source: ImageSource) -> None:
+        if isinstance(source, Image):
+            source = source.source
+        self.source = source
+        self.mime: str | None = None
+        self._encoded: str | None = None
+        self._task: asyncio.Task[str] | None = None
+
+        if isinstance(source, str):
+            if not source.startswith('data:'):
+                raise ValueError('Image strings must be data: URIs, pass paths as a pathlib.Path')
+            self._encoded = source
+            self.mime = source[5 : source.find(';')]
+
+    def __repr__(self) -> str:
+        return f'<Image mime={self.mime!r} encoded={self._encoded is not None}>'
+
+    @property
+    def encoded(self) -> bool:
+        return self._encoded is not None
+
+    async def _read(self) -> bytes | memoryview:
+        source = self.source
+        loop = asyncio.get_running_loop()
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return source
+        if isinstance(source, File):
+            data = source._view()
+            if data is not None:
+                return data
+            return await loop.run_in_executor(None, _read_stream, source)
+        if isinstance(source, os.PathLike):
+            return await loop.run_in_executor(None, _read_path, source)
+
+        data = await source.read()
+        if data is None:
+            raise ValueError(f'Could not read image from {source!r}')
+        return data
+
+    async def _encode(self) -> str:
+        data = memoryview(await self._read()).cast('B')
+        mime = _get_image_mime_type(bytes(data[:16]))
+        if data.nbytes > ENCODE_THREAD_THRESHOLD:
+            encoded = await asyncio.get_running_loop().run_in_executor(None, _encode, data, mime)
+        else:
+            encoded = _encode(data, mime)
+        self.mime = mime
+        return encoded
+
+    async def encode(self) -> str:
+        """Encodes the image into a data URI, or returns the one encoded before.
+
+        Raises:
+            ValueError: The image isn't a PNG, JPEG, GIF or WebP, or couldn't be read.
+
+        Returns:
+            The image as a ``data:`` URI.
+        """
+        if self._encoded is not None:
+            return self._encoded
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._encode())
+        try:
+            # the same image can be passed to several concurrent edits, so one of them
+            # being cancelled mustn't cancel the encode the others are waiting on
+            self._encoded = await asyncio.shield(self._task)
+        except Exception:
+            self._task = None
+            raise
+        return self._encoded
+
+
+async def _resolve_image(image: ImageSource | None) -> str | None:
+    # route helpers take anything an Image does, and None to remove the image
+    if image is None:
+        return None
+    if not isinstance(image, Image):
+        image = Image(image)
+    return await image.encode()
@@ -20,36 +20,382 @@
 
 
 import asyncio
-from typing import TYPE_CHECKING
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import TYPE_CHECKING, Mapping
 
 if TYPE_CHECKING:
     from .http import Route
 
 
-class Block:
+def parse_ratelimit_headers(headers: Mapping[str, str]) -> tuple[int, int, float] | None:
+    """Returns the limit, remaining requests and seconds until reset of a response's bucket, if it has one."""
+    try:
+        return (
+            int(headers['X-RateLimit-Limit']),
+            int(headers['X-RateLimit-Remaining']),
+            float(headers['X-RateLimit-Reset-After']),
+        )
+    except (KeyError, ValueError):
+        return None
+
+
+class Priority(IntEnum):
+    """
+    How urgently a request should be let through when it has to queue, lower goes first.
+    """
+
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+class QueueLatency:
+    """
+    Time spent by requests of a priority waiting on ratelimits.
+    """
+
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+
+    def __repr__(self) -> str:
+        return f'<QueueLatency count={self.count} mean={self.mean:.4f} max={self.max:.4f}>'
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+
+class _Limiter:
+    """
+    Base for limiters which hand out slots to queued requests by priority, then in order.
+    """
+
+    def __init__(self) -> None:
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._counter = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _refill(self) -> None:
+        pass
+
+    def _available(self) -> bool:
+        raise NotImplementedError
+
+    def _take(self) -> None:
+        raise NotImplementedError
+
+    def _give_back(self) -> None:
+        raise NotImplementedError
+
+    def _next_wake(self) -> float | None:
+        # monotonic time at which a slot may free up without a response arriving
+        return None
+
+    async def acquire(self, priority: Priority = Priority.NORMAL) -> None:
+        self._refill()
+        if not self._waiters and self._available():
+            self._take()
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._counter), fut)
+        heapq.heappush(self._waiters, entry)
+        # capacity may have come back since the last wake up, hand it out by priority
+        self._wake()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # we were handed a slot, but won't use it
+                self._give_back()
+                self._wake()
+            else:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def _wake(self) -> None:
+        self._refill()
+        while self._waiters and self._available():
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():
+                continue
+            self._take()
+            fut.set_result(None)
+        self._schedule()
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._wake()
+
+    def _schedule(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._waiters or self._available():
+            return
+        when = self._next_wake()
+        if when is not None:
+            self._timer = asyncio.get_running_loop().call_later(max(when - time.monotonic(), 0), self._on_timer)
+
+
+class Bucket(_Limiter):
+    """
+    Tracks a single ratelimit bucket and holds requests before they hit it.
+
+    A bucket starts with a single slot until Discord tells us its real limits, so
+    concurrent requests to a new route queue up behind the first one instead of all
+    racing into a 429. A route answered without ratelimit headers isn't limited at all.
+    """
+
+    def __init__(self, key: str):
+        super().__init__()
+        self.key = key
+        self.limit: int = 1
+        self.remaining: int = 1
+        self.reset_at: float = 0.0
+        self.inflight: int = 0
+        self.unlimited = False
+
+    @property
+    def idle(self) -> bool:
+        return not self._waiters and not self.inflight and self.reset_at <= time.monotonic()
+
+    def _refill(self) -> None:
+        if self.reset_at and self.reset_at <= time.monotonic():
+            self.remaining = self.limit
+            self.reset_at = 0.0
+
+    def _available(self) -> bool:
+        return self.unlimited or self.remaining > 0
+
+    def _take(self) -> None:
+        self.remaining -= 1
+        self.inflight += 1
+
+    def _give_back(self) -> None:
+        self.remaining += 1
+        self.inflight -= 1
+
+    def _next_wake(self) -> float | None:
+        return self.reset_at or None
+
+    def release(self) -> None:
+        # the request finished without telling us anything about the bucket
+        self.inflight -= 1
+        if not self.reset_at:
+            self.remaining = min(self.remaining + 1, self.limit)
+        self._wake()
+
+    def lift(self) -> None:
+        # the response had no ratelimit headers, so the route has no bucket to wait on
+        self.unlimited = True
+        self.release()
+
+    def update(self, limit: int, remaining: int, reset_after: float) -> None:
+        self.inflight -= 1
+        self.unlimited = False
+        self.limit = limit
+        # other requests in flight have already taken their slot
+        self.remaining = max(remaining - self.inflight, 0)
+        self.reset_at = time.monotonic() + reset_after
+        self._wake()
+
+
+class GlobalRatelimiter(_Limiter):
     """
-    This class temporarily blocks requests after hitting a ratelimit
+    A token bucket pacing every request made with a token under the global ratelimit.
+
+    Requests over the budget are queued and released by priority as tokens refill,
+    and a global 429 empties the bucket until its ``Retry-After`` passes.
+
+    Parameters:
+        rate: The number of requests allowed per period.
+        per: The length of the period in seconds.
     """
 
-    def __init__(self, route: "Route"):
-        self._event: asyncio.Event | None = None
-        self.route: "Route" | None = route
-        self.is_global: bool = False
+    def __init__(self, rate: int = 50, per: float = 1.0):
+        super().__init__()
+        self.rate = rate
+        self.per = per
+        self.tokens: float = rate
+        self.blocked_until: float = 0.0
+        self._last = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        start = max(self._last, self.blocked_until)
+        if now > start:
+            self.tokens = min(self.rate, self.tokens + (now - start) * self.rate / self.per)
+            self._last = now
+
+    def _available(self) -> bool:
+        return self.tokens >= 1 and self.blocked_until <= time.monotonic()
+
+    def _take(self) -> None:
+        self.tokens -= 1
+
+    def _give_back(self) -> None:
+        self.tokens = min(self.rate, self.tokens + 1)
+
+    def _next_wake(self) -> float | None:
+        start = max(self._last, self.blocked_until)
+        return start + max(1 - self.tokens, 0) * self.per / self.rate
+
+    def block(self, retry_after: float) -> None:
+        self.tokens = 0
+        self._last = time.monotonic()
+        self.blocked_until = self._last + retry_after
+        self._schedule()
+
+
+class AdaptiveConcurrency(_Limiter):
+    """
+    Caps the number of requests in flight, adjusting the cap to how the API responds.
+
+    The limit grows by one for every ``limit`` requests answered quickly while it is
+    mostly in use, and is cut by ``backoff`` whenever a request is ratelimited, fails
+    with a 5xx, times out or takes over ``latency_tolerance`` times the usual latency
+    of its route plus ``latency_slack``. Routes keep their own usual latency, so ones
+    slow by nature, like uploads or bulk deletes, don't read as overload.
+
+    Parameters:
+        initial: The limit to start with.
+        min_limit: The lowest the limit may go.
+        max_limit: The highest the limit may go.
+        backoff: What the limit is multiplied by on a sign of overload.
+        latency_tolerance: How many times slower than the usual latency a response has to be to count as overload.
+        latency_slack: Seconds added to that, so event loop hiccups on fast connections aren't taken as overload.
+    """
+
+    def __init__(
+        self,
+        initial: int = 20,
+        *,
+        min_limit: int = 1,
+        max_limit: int = 200,
+        backoff: float = 0.9,
+        latency_tolerance: float = 2.0,
+        latency_slack: float = 0.05,
+    ):
+        super().__init__()
+        self._limit: float = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.latency_slack = latency_slack
+        self.inflight: int = 0
+        # usual latency per route
+        self.baselines: dict[str, float] = {}
+
+    def __repr__(self) -> str:
+        return f'<AdaptiveConcurrency limit={self.limit} inflight={self.inflight} queued={self.queue_depth}>'
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _available(self) -> bool:
+        return self.inflight < self.limit
+
+    def _take(self) -> None:
+        self.inflight += 1
+
+    def _give_back(self) -> None:
+        self.inflight -= 1
+
+    def release(self, latency: float | None = None, *, route: str = '', dropped: bool = False) -> None:
+        """
+        Frees a request's slot.
+
+        ``latency`` is how long the request to ``route`` took, ``dropped`` whether it was ratelimited
+        or failed from overload. Requests which give neither, like cancelled ones, leave the limit alone.
+        """
+        self.inflight -= 1
+        if dropped:
+            self._limit = max(self.min_limit, self._limit * self.backoff)
+        elif latency is not None:
+            baseline = self.baselines.get(route)
+            if baseline is None or latency < baseline:
+                baseline = latency
+            else:
+                # follow lasting changes in latency slowly, so they aren't taken as overload forever
+                baseline += (latency - baseline) * 0.01
+            self.baselines[route] = baseline
+
+            if latency > baseline * self.latency_tolerance + self.latency_slack:
+                self._limit = max(self.min_limit, self._limit * self.backoff)
+            elif self.inflight * 2 >= self._limit:
+                # only grow while the limit is what's holding requests back
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+        self._wake()
+
+
+class BucketManager:
+    """
+    Maps routes onto their :class:`Bucket`, learning the real bucket from ``X-RateLimit-Bucket``.
+    """
 
-    async def wait(self):
-        if self._event:
-            await self._event.wait()
+    def __init__(self, prune_interval: float = 60.0):
+        # "METHOD /path/{template}" -> bucket hash sent by discord
+        self._hashes: dict[str, str] = {}
+        # "hash:major parameters" -> Bucket
+        self._buckets: dict[str, Bucket] = {}
+        self._prune_interval = prune_interval
+        self._last_prune = time.monotonic()
 
-    async def block(self, reset_after: int | float, bucket: str, globalrt: bool):
-        self.bucket_denom = bucket
-        self.is_global = globalrt
+    def get(self, method: str, route: "Route") -> Bucket:
+        route_key = route.compiled.route_key(method)
+        key = f'{self._hashes.get(route_key, route_key)}:{route.major}'
 
-        self._event = asyncio.Event()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._maybe_prune()
+            bucket = self._buckets[key] = Bucket(key)
+        return bucket
 
-        await asyncio.sleep(reset_after)
+    def update(self, bucket: Bucket, method: str, route: "Route", headers: Mapping[str, str]) -> None:
+        bucket_hash = headers.get('X-RateLimit-Bucket')
+        if bucket_hash is not None:
+            route_key = route.compiled.route_key(method)
+            if self._hashes.get(route_key) != bucket_hash:
+                self._hashes[route_key] = bucket_hash
+            key = f'{bucket_hash}:{route.major}'
+            if bucket.key != key and self._buckets.setdefault(key, bucket) is bucket:
+                # buckets made before the hash was known are re-keyed, so every process
+                # names the same discord bucket the same way to the coordinator
+                if self._buckets.get(bucket.key) is bucket:
+                    del self._buckets[bucket.key]
+                bucket.key = key
 
-        self.end()
+        limits = parse_ratelimit_headers(headers)
+        if limits is None:
+            bucket.lift()
+        else:
+            bucket.update(*limits)
 
-    def end(self):
-        if self._event:
-            self._event.set()
+    def _maybe_prune(self) -> None:
+        now = time.monotonic()
+        if now - self._last_prune < self._prune_interval:
+            return
+        self._last_prune = now
+        for key in [k for k, b in self._buckets.items() if b.idle]:
+            del self._buckets[key]
@@ -8,5 +8,6 @@ Implementation of the Discord Gateway.
 """
 
 from .cluster import *
+from .compression import *
 from .manager import *
 from .shard import *
@@ -19,4 +19,451 @@
 # SOFTWARE.
 """
 A shard cluster is a cluster of multiple shards, these can theoretically be ran separately and can use k8s to scale further.
+
+:class:`ShardCluster` splits a bot's shards over worker processes, each with its own event
+loop, :class:`~trak.state.ConnectionState` and HTTP client. The supervising process restarts
+workers which exit, paces IDENTIFYs for all of them and relays messages between them.
 """
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import tempfile
+from typing import TYPE_CHECKING, Any, Awaitable, Callable
+
+from discord_typings import SessionStartLimitData
+
+from trak import utils
+from trak.internal.http.coordinator import RatelimitCoordinator
+
+from .manager import IdentifyRatelimiter
+
+if TYPE_CHECKING:
+    from trak.app.gateway import GatewayApp
+
+__all__ = ('ShardCluster', 'ClusterIPC')
+
+_log = logging.getLogger(__name__)
+
+Listener = Callable[[Any], Awaitable[None]]
+Handler = Callable[[Any], Awaitable[Any]]
+
+
+def _shard_ranges(shard_count: int, clusters: int) -> list[list[int]]:
+    # contiguous and as even as possible, so guilds stay with the same worker across restarts
+    size, extra = divmod(shard_count, clusters)
+    ranges = []
+    start = 0
+    for i in range(clusters):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return [r for r in ranges if r]
+
+
+class _Connection:
+    # both ends of the IPC socket speak newline-delimited JSON
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+
+    def send(self, message: dict[str, Any]) -> None:
+        if not self.writer.is_closing():
+            self.writer.write(utils.dumps(message).encode('utf-8') + b'\n')
+
+    async def messages(self):
+        while line := await self.reader.readline():
+            yield utils.loads(line)
+
+
+class _RemoteIdentifyRatelimiter(IdentifyRatelimiter):
+    """Asks the cluster's supervisor for identify slots, so workers don't overlap their ratelimit keys."""
+
+    def __init__(self, ipc: 'ClusterIPC') -> None:
+        super().__init__()
+        self._ipc = ipc
+
+    def update(self, limit: SessionStartLimitData) -> None:
+        # the supervisor keeps track of the session starts
+        pass
+
+    async def acquire(self, shard_id: int) -> None:
+        await self._ipc._request('identify', shard_id=shard_id)
+
+    def identified(self, shard_id: int) -> None:
+        if self._ipc._conn is not None:
+            self._ipc._conn.send({'op': 'identified', 'shard_id': shard_id})
+
+
+class ClusterIPC:
+    """
+    A worker process's channel to the rest of its :class:`ShardCluster`.
+
+    Available as ``app.ipc`` in every worker.
+
+    Parameters:
+        path: The unix socket path of the supervisor.
+        cluster_id: This worker's index in the cluster.
+    """
+
+    def __init__(self, path: str, cluster_id: int) -> None:
+        self.path = path
+        self.cluster_id = cluster_id
+        self.identify_ratelimiter = _RemoteIdentifyRatelimiter(self)
+        self._conn: _Connection | None = None
+        self._nonce = itertools.count()
+        self._waiters: dict[int, asyncio.Future[Any]] = {}
+        self._listeners: dict[str, list[Listener]] = {}
+        self._handlers: dict[str, Handler] = {}
+        self._closed = asyncio.Event()
+        self._read_task: asyncio.Task | None = None
+
+    async def connect(self) -> None:
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        self._conn = _Connection(reader, writer)
+        self._conn.send({'op': 'hello', 'cluster': self.cluster_id})
+        self._read_task = asyncio.create_task(self._read())
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            self._conn.writer.close()
+        self._closed.set()
+
+    async def wait_closed(self) -> None:
+        """Waits until the supervisor stops this worker or goes away."""
+        await self._closed.wait()
+
+    def on(self, event: str, listener: Listener) -> None:
+        """Calls ``listener`` with the data of every ``event`` broadcast by another cluster."""
+        self._listeners.setdefault(event, []).append(listener)
+
+    def handle(self, name: str, handler: Handler) -> None:
+        """
+        Answers ``name`` queries from other clusters with what ``handler`` returns,
+        which must be JSON serializable.
+        """
+        self._handlers[name] = handler
+
+    def broadcast(self, event: str, data: Any = None) -> None:
+        """Sends ``event`` to every other cluster and the supervisor."""
+        self._conn.send({'op': 'broadcast', 'event': event, 'data': data})  # type: ignore
+
+    async def query(self, name: str, data: Any = None, *, timeout: float = 10.0) -> list[Any]:
+        """Asks every cluster, this one included, to answer ``name``, returning the answers in cluster order."""
+        return await self._request('query', name=name, data=data, timeout=timeout)
+
+    async def _request(self, op: str, **fields: Any) -> Any:
+        nonce = next(self._nonce)
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[nonce] = fut
+        self._conn.send({'op': op, 'nonce': nonce, **fields})  # type: ignore
+        try:
+            return await fut
+        finally:
+            self._waiters.pop(nonce, None)
+
+    async def _answer(self, message: dict[str, Any]) -> None:
+        handler = self._handlers.get(message['name'])
+        reply: dict[str, Any] = {'op': 'reply', 'nonce': message['nonce']}
+        if handler is None:
+            reply['error'] = f'cluster {self.cluster_id} has no handler for {message["name"]!r}'
+        else:
+            try:
+                reply['data'] = await handler(message['data'])
+            except Exception as exc:
+                _log.exception(f'Cluster query handler for {message["name"]!r} failed')
+                reply['error'] = repr(exc)
+        self._conn.send(reply)  # type: ignore
+
+    async def _read(self) -> None:
+        try:
+            async for message in self._conn.messages():  # type: ignore
+                op = message['op']
+                if op == 'done':
+                    fut = self._waiters.get(message['nonce'])
+                    if fut is not None and not fut.done():
+                        fut.set_result(message.get('data'))
+                elif op == 'event':
+                    for listener in self._listeners.get(message['event'], ()):
+                        asyncio.create_task(listener(message['data']))
+                elif op == 'request':
+                    asyncio.create_task(self._answer(message))
+                elif op == 'stop':
+                    break
+        except (ConnectionError, ValueError) as exc:
+            _log.error(f'Lost connection to the cluster supervisor: {exc!r}')
+        finally:
+            self._closed.set()
+            for fut in self._waiters.values():
+                if not fut.done():
+                    fut.set_exception(ConnectionError('Lost connection to the cluster supervisor'))
+
+
+def _run_worker(
+    factory: Callable[[], 'GatewayApp'],
+    token: str,
+    cluster_id: int,
+    shard_ids: list[int],
+    shard_count: int,
+    ipc_path: str,
+    coordinator_path: str,
+) -> None:
+    async def main() -> None:
+        ipc = ClusterIPC(ipc_path, cluster_id)
+        await ipc.connect()
+
+        app = factory()
+        app.ipc = ipc
+        app.shards = shard_count
+        if app.ratelimit_coordinator is None:
+            app.ratelimit_coordinator = coordinator_path
+
+        await app.start_shards(token, shard_ids=shard_ids, identify_ratelimiter=ipc.identify_ratelimiter)
+        _log.info(f'Cluster {cluster_id} running shards {shard_ids[0]}-{shard_ids[-1]}')
+        await ipc.wait_closed()
+        # disconnects the shards with a close frame before the HTTP session goes,
+        # so Discord doesn't wait for the sessions to time out
+        await app.close()
+
+    asyncio.run(main())
+
+
+class ShardCluster:
+    """
+    Runs a bot's shards over several processes.
+
+    Each worker process calls ``factory`` to build its own app, then runs a contiguous range of
+    the shards on its own event loop. Workers which exit are restarted with the same shards.
+    REST ratelimits are shared through a :class:`~trak.internal.http.coordinator.RatelimitCoordinator`
+    and identifies are paced by the supervisor, so workers stay within the bot's limits together.
+
+    Parameters:
+        factory: A module level function returning the :class:`~trak.app.gateway.GatewayApp` a
+                 worker runs, with its listeners added. It's pickled into each worker process.
+        clusters: The number of worker processes, one per CPU if ``None``.
+        shards: The total number of shards, ``None`` to use the count Discord recommends.
+        version: The API version.
+        ipc_path: The unix socket path workers connect to, in the temporary directory if ``None``.
+        restart_delay: Seconds to wait before restarting a worker which exited, doubling while it keeps exiting.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], 'GatewayApp'],
+        *,
+        clusters: int | None = None,
+        shards: int | None = None,
+        version: int = 10,
+        ipc_path: str | None = None,
+        restart_delay: float = 5.0,
+    ) -> None:
+        self.factory = factory
+        self.clusters = clusters or os.cpu_count() or 1
+        self.shards = shards
+        self.version = version
+        self.ipc_path = ipc_path or os.path.join(tempfile.gettempdir(), f'trak-cluster-{os.getpid()}.sock')
+        self.restart_delay = restart_delay
+        self.identify_ratelimiter = IdentifyRatelimiter()
+        self.coordinator = RatelimitCoordinator(f'{self.ipc_path}.ratelimit')
+
+        self._token = ''
+        self._ranges: list[list[int]] = []
+        self._processes: dict[int, multiprocessing.process.BaseProcess] = {}
+        self._exited: dict[int, asyncio.Future[None]] = {}
+        self._connections: dict[int, _Connection] = {}
+        self._listeners: dict[str, list[Listener]] = {}
+        self._queries: dict[int, tuple[asyncio.Future[list[Any]], dict[int, Any]]] = {}
+        self._nonce = itertools.count()
+        self._server: asyncio.AbstractServer | None = None
+        self._closing = False
+        self._context = multiprocessing.get_context('spawn')
+
+    def run(self, token: str) -> None:
+        """Runs the cluster until interrupted."""
+        try:
+            asyncio.run(self.start(token))
+        except KeyboardInterrupt:
+            pass
+
+    async def start(self, token: str) -> None:
+        from trak.internal.http import HTTPClient
+
+        self._token = token
+        http = HTTPClient(token, self.version)
+        try:
+            data = await http.get_gateway_bot()
+        finally:
+            if http._session is not None:
+                await http._session.close()
+        self.identify_ratelimiter.update(data['session_start_limit'])
+        shard_count = self.shards or data['shards']
+        self._ranges = _shard_ranges(shard_count, self.clusters)
+
+        await self.coordinator.start()
+        if os.path.exists(self.ipc_path):
+            os.remove(self.ipc_path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.ipc_path)
+
+        _log.info(f'Running {shard_count} shards over {len(self._ranges)} clusters')
+        try:
+            await asyncio.gather(
+                *(self._supervise(cluster_id, shard_count) for cluster_id in range(len(self._ranges)))
+            )
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """Stops every worker and the cluster's servers."""
+        if self._closing:
+            return
+        self._closing = True
+        for conn in self._connections.values():
+            conn.send({'op': 'stop'})
+
+        for cluster_id, process in self._processes.items():
+            exited = self._exited[cluster_id]
+            try:
+                await asyncio.wait_for(asyncio.shield(exited), 10)
+            except asyncio.TimeoutError:
+                process.terminate()
+                await asyncio.shield(exited)
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.coordinator.close()
+
+    def _watch(self, process: multiprocessing.process.BaseProcess) -> asyncio.Future[None]:
+        # resolves once the process exits, without tying up an executor thread per worker
+        loop = asyncio.get_running_loop()
+        exited = loop.create_future()
+
+        def on_exit() -> None:
+            loop.remove_reader(process.sentinel)
+            process.join()
+            if not exited.done():
+                exited.set_result(None)
+
+        loop.add_reader(process.sentinel, on_exit)
+        return exited
+
+    async def _supervise(self, cluster_id: int, shard_count: int) -> None:
+        loop = asyncio.get_running_loop()
+        delay = self.restart_delay
+        while not self._closing:
+            process = self._context.Process(
+                target=_run_worker,
+                args=(
+                    self.factory,
+                    self._token,
+                    cluster_id,
+                    self._ranges[cluster_id],
+                    shard_count,
+                    self.ipc_path,
+                    self.coordinator.path,
+                ),
+                name=f'trak-cluster-{cluster_id}',
+            )
+            process.start()
+            self._processes[cluster_id] = process
+            self._exited[cluster_id] = exited = self._watch(process)
+            started = loop.time()
+
+            # shielded, close() waits on the same future after this task is cancelled
+            await asyncio.shield(exited)
+            if self._closing:
+                return
+
+            # a worker which ran for a while gets restarted quickly again
+            if loop.time() - started > 60:
+                delay = self.restart_delay
+            _log.warning(f'Cluster {cluster_id} exited with {process.exitcode}, restarting in {delay:g}s')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 300)
+
+    def on(self, event: str, listener: Listener) -> None:
+        """Calls ``listener`` with the data of every ``event`` broadcast by a worker."""
+        self._listeners.setdefault(event, []).append(listener)
+
+    def broadcast(self, event: str, data: Any = None, *, exclude: int | None = None) -> None:
+        """Sends ``event`` to every worker."""
+        for cluster_id, conn in self._connections.items():
+            if cluster_id != exclude:
+                conn.send({'op': 'event', 'event': event, 'data': data})
+
+    async def query(self, name: str, data: Any = None, *, timeout: float = 10.0) -> list[Any]:
+        """
+        Asks every worker to answer ``name``, returning the answers in cluster order.
+
+        Workers which don't answer within ``timeout``, or fail to, are left out.
+        """
+        nonce = next(self._nonce)
+        fut: asyncio.Future[list[Any]] = asyncio.get_running_loop().create_future()
+        replies: dict[int, Any] = {}
+        self._queries[nonce] = (fut, replies)
+        expected = set(self._connections)
+        for conn in self._connections.values():
+            conn.send({'op': 'request', 'nonce': nonce, 'name': name, 'data': data})
+
+        try:
+            if expected:
+                await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except asyncio.TimeoutError:
+            _log.warning(f'Clusters {sorted(expected - set(replies))} did not answer {name!r} in time')
+        finally:
+            self._queries.pop(nonce, None)
+        return [replies[cluster_id] for cluster_id in sorted(replies) if replies[cluster_id] is not _FAILED]
+
+    def _on_reply(self, cluster_id: int, message: dict[str, Any]) -> None:
+        query = self._queries.get(message['nonce'])
+        if query is None:
+            return
+        fut, replies = query
+        if 'error' in message:
+            _log.warning(f'Cluster {cluster_id} failed to answer a query: {message["error"]}')
+            replies[cluster_id] = _FAILED
+        else:
+            replies[cluster_id] = message.get('data')
+        if set(self._connections) <= set(replies) and not fut.done():
+            fut.set_result([])
+
+    async def _identify(self, conn: _Connection, message: dict[str, Any]) -> None:
+        await self.identify_ratelimiter.acquire(message['shard_id'])
+        conn.send({'op': 'done', 'nonce': message['nonce']})
+
+    async def _query_for(self, conn: _Connection, message: dict[str, Any]) -> None:
+        data = await self.query(message['name'], message.get('data'), timeout=message.get('timeout', 10.0))
+        conn.send({'op': 'done', 'nonce': message['nonce'], 'data': data})
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        conn = _Connection(reader, writer)
+        cluster_id: int | None = None
+        try:
+            async for message in conn.messages():
+                op = message['op']
+                if op == 'hello':
+                    cluster_id = message['cluster']
+                    self._connections[cluster_id] = conn  # type: ignore
+                elif op == 'identify':
+                    asyncio.create_task(self._identify(conn, message))
+                elif op == 'identified':
+                    self.identify_ratelimiter.identified(message['shard_id'])
+                elif op == 'broadcast':
+                    self.broadcast(message['event'], message['data'], exclude=cluster_id)
+                    for listener in self._listeners.get(message['event'], ()):
+                        asyncio.create_task(listener(message['data']))
+                elif op == 'query':
+                    asyncio.create_task(self._query_for(conn, message))
+                elif op == 'reply':
+                    self._on_reply(cluster_id, message)  # type: ignore
+        except (ConnectionError, ValueError) as exc:
+            _log.debug(f'Cluster {cluster_id} disconnected: {exc!r}')
+        finally:
+            if cluster_id is not None and self._connections.get(cluster_id) is conn:
+                del self._connections[cluster_id]
+            writer.close()
+
+
+# marks a cluster which failed to answer a query
+_FAILED = object()
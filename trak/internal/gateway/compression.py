@@ -0,0 +1,181 @@
+# Copyright (c) 2021-2022 VincentRPS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Transport compression for Gateway connections.
+
+A connection is compressed as one stream, so each :class:`TransportCompression` keeps the
+state of one connection and is reset for the next.
+"""
+import zlib
+from typing import Literal, Protocol
+
+from trak.errors import GatewayException
+
+try:
+    import zstandard
+
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+__all__ = (
+    'ZLIB_SUFFIX',
+    'MAX_PAYLOAD_SIZE',
+    'Compression',
+    'TransportCompression',
+    'NoCompression',
+    'ZlibStream',
+    'ZstdStream',
+    'get_compression',
+)
+
+ZLIB_SUFFIX = b'\x00\x00\xff\xff'
+# far above anything Discord sends, a payload inflating past this is a broken stream
+MAX_PAYLOAD_SIZE = 2**26
+
+Compression = Literal['zlib-stream', 'zstd-stream', 'none']
+
+
+class TransportCompression(Protocol):
+    """
+    Decompresses the messages of one Gateway connection.
+
+    Implementations raise :class:`ValueError` on a corrupt stream, which stays unusable until :meth:`reset`.
+    """
+
+    name: Compression
+
+    def reset(self) -> None:
+        """Starts a new stream, for a new connection."""
+        ...
+
+    def feed(self, data: bytes) -> bytes | None:
+        """Decompresses a message, returning ``None`` while a payload is split over several messages."""
+        ...
+
+
+class NoCompression(TransportCompression):
+    """Passes messages through, for connections without transport compression."""
+
+    name = 'none'
+
+    def reset(self) -> None:
+        pass
+
+    def feed(self, data: bytes) -> bytes | None:
+        return data
+
+
+class ZlibStream(TransportCompression):
+    """
+    Inflates a ``zlib-stream`` connection.
+
+    Parameters:
+        max_payload_size: The most bytes a payload may inflate to.
+    """
+
+    name = 'zlib-stream'
+
+    def __init__(self, max_payload_size: int = MAX_PAYLOAD_SIZE) -> None:
+        self.max_payload_size = max_payload_size
+        self._buf = bytearray()
+        self._inf = zlib.decompressobj()
+
+    def reset(self) -> None:
+        self._buf.clear()
+        self._inf = zlib.decompressobj()
+
+    def feed(self, data: bytes) -> bytes | None:
+        if not data.endswith(ZLIB_SUFFIX):
+            if len(self._buf) + len(data) > self.max_payload_size:
+                raise ValueError(f'payload split over more than {self.max_payload_size} bytes')
+            self._buf += data
+            return None
+
+        if self._buf:
+            # only split payloads are copied, whole ones are inflated straight from the message
+            self._buf += data
+            data = self._buf
+        try:
+            payload = self._inf.decompress(data, self.max_payload_size)
+        except zlib.error as exc:
+            raise ValueError(str(exc)) from exc
+        finally:
+            self._buf.clear()
+
+        if self._inf.unconsumed_tail:
+            raise ValueError(f'payload inflates past {self.max_payload_size} bytes')
+        return payload
+
+
+class ZstdStream(TransportCompression):
+    """
+    Decompresses a ``zstd-stream`` connection, needs the ``zstandard`` package.
+
+    Discord flushes the stream after every payload and sends each in one message,
+    so every message decompresses to a whole payload.
+
+    Parameters:
+        max_payload_size: The most bytes a payload may decompress to.
+    """
+
+    name = 'zstd-stream'
+
+    def __init__(self, max_payload_size: int = MAX_PAYLOAD_SIZE) -> None:
+        if not HAS_ZSTD:
+            raise GatewayException('zstd-stream compression needs the zstandard package installed.')
+        self.max_payload_size = max_payload_size
+        # zstd can't stop at a length, so messages are fed in slices which can't decompress
+        # past the limit: a block takes at least 4 bytes and holds at most 128KiB
+        self._step = max(max_payload_size // 2**15, 64)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._inf = self._decompressor.decompressobj()
+
+    def reset(self) -> None:
+        self._inf = self._decompressor.decompressobj()
+
+    def feed(self, data: bytes) -> bytes | None:
+        view = memoryview(data)
+        chunks: list[bytes] = []
+        size = 0
+        try:
+            for start in range(0, len(view), self._step):
+                chunk = self._inf.decompress(view[start : start + self._step])
+                size += len(chunk)
+                if size > self.max_payload_size:
+                    raise ValueError(f'payload decompresses past {self.max_payload_size} bytes')
+                chunks.append(chunk)
+        except zstandard.ZstdError as exc:
+            raise ValueError(str(exc)) from exc
+        if not size:
+            # the message only held part of a frame
+            return None
+        return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+
+def get_compression(name: Compression) -> TransportCompression:
+    """Creates the :class:`TransportCompression` for ``name``, raising :class:`GatewayException` if it's unknown."""
+    if name == 'zlib-stream':
+        return ZlibStream()
+    if name == 'zstd-stream':
+        return ZstdStream()
+    if name == 'none':
+        return NoCompression()
+    raise GatewayException(f'Unknown Gateway compression {name!r}, expected zlib-stream, zstd-stream or none.')
@@ -0,0 +1,231 @@
+# Copyright (c) 2021-2022 VincentRPS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Encodes and decodes the Erlang External Term Format, for Gateway connections with ``encoding=etf``.
+
+Terms decode to the same shapes as Discord's JSON: binaries and atoms to :class:`str`, maps to
+:class:`dict` and lists and tuples to :class:`list`. Discord sends snowflakes as integers over ETF,
+integers too large for a JSON number are decoded to :class:`str` as the JSON encoding has them.
+
+ETF trades CPU for bandwidth. Payloads are a little smaller uncompressed, but once a transport
+compression is used the two encodings come out within a few percent of each other, while decoding
+here in pure Python costs several times the CPU per event of JSON through orjson (see
+``benchmarks/gateway.py``). JSON stays the default for that reason.
+
+There's no C accelerated decoder: erlpack decodes binaries to :class:`bytes` and atoms to its own
+type, so reshaping its output in Python would give back most of what it saves.
+"""
+import struct
+import zlib
+from typing import Any
+
+__all__ = ('loads', 'dumps')
+
+FORMAT_VERSION = 131
+
+NEW_FLOAT_EXT = 70
+COMPRESSED = 80
+SMALL_INTEGER_EXT = 97
+INTEGER_EXT = 98
+FLOAT_EXT = 99
+ATOM_EXT = 100
+SMALL_TUPLE_EXT = 104
+LARGE_TUPLE_EXT = 105
+NIL_EXT = 106
+STRING_EXT = 107
+LIST_EXT = 108
+BINARY_EXT = 109
+SMALL_BIG_EXT = 110
+LARGE_BIG_EXT = 111
+SMALL_ATOM_EXT = 115
+MAP_EXT = 116
+ATOM_UTF8_EXT = 118
+SMALL_ATOM_UTF8_EXT = 119
+
+# the largest integer a JSON number holds exactly, snowflakes are above it
+MAX_SAFE_INTEGER = 2**53
+
+_ATOMS = {'nil': None, 'true': True, 'false': False}
+
+_u16 = struct.Struct('>H').unpack_from
+_u32 = struct.Struct('>I').unpack_from
+_i32 = struct.Struct('>i').unpack_from
+_f64 = struct.Struct('>d').unpack_from
+
+_pack_u8 = struct.Struct('>BB').pack
+_pack_i32 = struct.Struct('>Bi').pack
+_pack_u32 = struct.Struct('>BI').pack
+_pack_f64 = struct.Struct('>Bd').pack
+
+
+def _atom(name: str) -> Any:
+    return _ATOMS.get(name, name)
+
+
+def _big(data: bytes, pos: int, n: int) -> tuple[Any, int]:
+    value = int.from_bytes(data[pos + 1 : pos + 1 + n], 'little')
+    # the magnitude decides, so a value decodes to the same type whatever its sign
+    if value >= MAX_SAFE_INTEGER:
+        value = str(value)
+        return ('-' + value if data[pos] else value), pos + 1 + n
+    return (-value if data[pos] else value), pos + 1 + n
+
+
+def _decode(data: bytes, pos: int) -> tuple[Any, int]:
+    # ordered by how often Discord sends each tag
+    tag = data[pos]
+    pos += 1
+
+    if tag == BINARY_EXT:
+        (size,) = _u32(data, pos)
+        pos += 4
+        return data[pos : pos + size].decode('utf-8'), pos + size
+    if tag == MAP_EXT:
+        (arity,) = _u32(data, pos)
+        pos += 4
+        result = {}
+        for _ in range(arity):
+            key, pos = _decode(data, pos)
+            result[key], pos = _decode(data, pos)
+        return result, pos
+    if tag == SMALL_INTEGER_EXT:
+        return data[pos], pos + 1
+    if tag == SMALL_ATOM_UTF8_EXT or tag == SMALL_ATOM_EXT:
+        size = data[pos]
+        pos += 1
+        return _atom(data[pos : pos + size].decode('utf-8')), pos + size
+    if tag == SMALL_BIG_EXT:
+        return _big(data, pos + 1, data[pos])
+    if tag == LIST_EXT:
+        (length,) = _u32(data, pos)
+        pos += 4
+        items = []
+        for _ in range(length):
+            item, pos = _decode(data, pos)
+            items.append(item)
+        tail, pos = _decode(data, pos)
+        if tail != []:
+            raise ValueError('improper lists are not supported')
+        return items, pos
+    if tag == NIL_EXT:
+        return [], pos
+    if tag == INTEGER_EXT:
+        return _i32(data, pos)[0], pos + 4
+    if tag == NEW_FLOAT_EXT:
+        return _f64(data, pos)[0], pos + 8
+    if tag == ATOM_UTF8_EXT or tag == ATOM_EXT:
+        (size,) = _u16(data, pos)
+        pos += 2
+        return _atom(data[pos : pos + size].decode('utf-8')), pos + size
+    if tag == SMALL_TUPLE_EXT or tag == LARGE_TUPLE_EXT:
+        if tag == SMALL_TUPLE_EXT:
+            arity = data[pos]
+            pos += 1
+        else:
+            (arity,) = _u32(data, pos)
+            pos += 4
+        items = []
+        for _ in range(arity):
+            item, pos = _decode(data, pos)
+            items.append(item)
+        return items, pos
+    if tag == STRING_EXT:
+        # a list of small integers, not text
+        (size,) = _u16(data, pos)
+        pos += 2
+        return list(data[pos : pos + size]), pos + size
+    if tag == LARGE_BIG_EXT:
+        return _big(data, pos + 4, _u32(data, pos)[0])
+    if tag == FLOAT_EXT:
+        return float(data[pos : pos + 31].rstrip(b'\x00')), pos + 31
+    raise ValueError(f'unsupported ETF tag {tag}')
+
+
+def loads(data: bytes) -> Any:
+    """Decodes an ETF payload, raising :class:`ValueError` if it's malformed."""
+    if not data or data[0] != FORMAT_VERSION:
+        raise ValueError('not an ETF payload')
+    try:
+        if data[1] == COMPRESSED:
+            (size,) = _u32(data, 2)
+            inflated = zlib.decompress(data[6:], bufsize=size)
+            value, pos = _decode(inflated, 0)
+            end = len(inflated)
+        else:
+            value, pos = _decode(data, 1)
+            end = len(data)
+    except (IndexError, struct.error, zlib.error) as exc:
+        raise ValueError(f'truncated ETF payload: {exc}') from exc
+    # slicing past the end doesn't raise, so short binaries show up here
+    if pos > end:
+        raise ValueError('truncated ETF payload')
+    if pos < end:
+        raise ValueError(f'{end - pos} trailing bytes after ETF payload')
+    return value
+
+
+def _encode(obj: Any, out: list[bytes]) -> None:
+    if isinstance(obj, str):
+        encoded = obj.encode('utf-8')
+        out.append(_pack_u32(BINARY_EXT, len(encoded)))
+        out.append(encoded)
+    elif obj is None:
+        out.append(b'\x77\x03nil')
+    elif obj is True:
+        out.append(b'\x77\x04true')
+    elif obj is False:
+        out.append(b'\x77\x05false')
+    elif isinstance(obj, int):
+        if 0 <= obj < 256:
+            out.append(_pack_u8(SMALL_INTEGER_EXT, obj))
+        elif -(2**31) <= obj < 2**31:
+            out.append(_pack_i32(INTEGER_EXT, obj))
+        else:
+            magnitude = abs(obj)
+            encoded = magnitude.to_bytes((magnitude.bit_length() + 7) // 8, 'little')
+            if len(encoded) > 255:
+                raise ValueError('integers over 255 bytes long are not supported')
+            out.append(bytes((SMALL_BIG_EXT, len(encoded), obj < 0)))
+            out.append(encoded)
+    elif isinstance(obj, float):
+        out.append(_pack_f64(NEW_FLOAT_EXT, obj))
+    elif isinstance(obj, dict):
+        out.append(_pack_u32(MAP_EXT, len(obj)))
+        for key, value in obj.items():
+            _encode(key, out)
+            _encode(value, out)
+    elif isinstance(obj, (list, tuple)):
+        if obj:
+            out.append(_pack_u32(LIST_EXT, len(obj)))
+            for item in obj:
+                _encode(item, out)
+        out.append(b'\x6a')
+    elif isinstance(obj, (bytes, bytearray)):
+        out.append(_pack_u32(BINARY_EXT, len(obj)))
+        out.append(bytes(obj))
+    else:
+        raise TypeError(f'Object of type {type(obj).__name__} is not ETF serializable')
+
+
+def dumps(obj: Any) -> bytes:
+    """Encodes ``obj`` to ETF, with strings as binaries and ``None`` as ``nil``."""
+    out = [b'\x83']
+    _encode(obj, out)
+    return b''.join(out)
@@ -18,45 +18,310 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import asyncio
+import logging
+import math
+import time
 
+from discord_typings import SessionStartLimitData
+
+from trak.errors import GatewayException
 from trak.state import BaseConnectionState
 
 from ..events import EventDispatcher
-from .shard import Shard
+from .compression import Compression, get_compression
+from .shard import Encoding, Shard
+
+_log = logging.getLogger(__name__)
+
+
+class IdentifyRatelimiter:
+    """
+    Paces IDENTIFYs so shards start as fast as Discord allows.
+
+    Shards share a ratelimit key when their ids are equal modulo ``max_concurrency``,
+    and each key may identify once every ``interval`` seconds, so up to ``max_concurrency``
+    shards identify at once. Every identify also takes one of the session starts left
+    for the day, waiting for them to reset once they run out.
+
+    A key is held from :meth:`acquire` until the shard calls :meth:`identified`, so the
+    interval is measured between IDENTIFYs actually sent rather than connection attempts.
+
+    Parameters:
+        max_concurrency: How many ratelimit keys shards are spread over.
+        interval: Seconds between identifies of the same key.
+        timeout: Seconds after which a key is let go if its shard never reported back.
+    """
+
+    def __init__(self, max_concurrency: int = 1, interval: float = 5.0, timeout: float = 30.0) -> None:
+        self.max_concurrency = max_concurrency
+        self.interval = interval
+        self.timeout = timeout
+        self.total: int | None = None
+        self.remaining: int | None = None
+        self.reset_at: float = 0.0
+        self._last: dict[int, float] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+        # shard id -> the key it holds and the timer letting it go
+        self._held: dict[int, tuple[int, asyncio.TimerHandle]] = {}
+        self._budget_lock = asyncio.Lock()
+
+    def update(self, limit: SessionStartLimitData) -> None:
+        self.max_concurrency = limit['max_concurrency']
+        self.total = limit['total']
+        self.remaining = limit['remaining']
+        self.reset_at = time.monotonic() + limit['reset_after'] / 1000
+
+    async def _take_session_start(self) -> None:
+        async with self._budget_lock:
+            if self.remaining is None:
+                return
+            if self.remaining <= 0:
+                delay = self.reset_at - time.monotonic()
+                if delay > 0:
+                    _log.warning(f'Out of session starts, waiting {delay:.0f}s for them to reset.')
+                    await asyncio.sleep(delay)
+                self.remaining = self.total
+                self.reset_at = time.monotonic() + 86400
+            self.remaining -= 1  # type: ignore
+
+    async def acquire(self, shard_id: int) -> None:
+        """Waits until ``shard_id`` may identify, which must be followed by :meth:`identified`."""
+        key = shard_id % self.max_concurrency
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+
+        # held while waiting, so shards of a key identify in the order they asked
+        await lock.acquire()
+        try:
+            delay = self._last.get(key, 0.0) + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._take_session_start()
+        except BaseException:
+            lock.release()
+            raise
+        timer = asyncio.get_running_loop().call_later(self.timeout, self.identified, shard_id)
+        self._held[shard_id] = (key, timer)
+
+    def identified(self, shard_id: int) -> None:
+        """Lets the next shard of ``shard_id``'s key go, once its IDENTIFY was sent or it gave up."""
+        held = self._held.pop(shard_id, None)
+        if held is None:
+            return
+        key, timer = held
+        timer.cancel()
+        self._last[key] = time.monotonic()
+        self._locks[key].release()
 
 
 class ShardManager:
-    def __init__(self, shards: int, state: BaseConnectionState, events: EventDispatcher, version: int = 10) -> None:
-        self._shards = shards
+    """
+    Runs every shard of the bot.
+
+    Parameters:
+        shards: The number of shards, ``None`` to use the count Discord recommends.
+        state: The connection state shards update.
+        events: The dispatcher shards send events to.
+        version: The gateway version.
+        encoding: How payloads are encoded, ``'json'`` or ``'etf'``. ETF is decoded in pure Python and
+                  costs more CPU per event, see [etf][trak.internal.gateway.etf].
+        compression: How connections are compressed, ``'zlib-stream'``, ``'zstd-stream'`` or ``'none'``.
+        reshard_interval: When the shard count is picked by Discord, how often in seconds
+                          to check whether it recommends more shards and reshard if so.
+        shard_ids: The ids of the shards to run, all of them if ``None``.
+                   Used to split shards between processes.
+        identify_ratelimiter: The ratelimiter shards identify through, shared by managers
+                              of the same bot in one process.
+    """
+
+    def __init__(
+        self,
+        shards: int | None,
+        state: BaseConnectionState,
+        events: EventDispatcher,
+        version: int = 10,
+        *,
+        encoding: Encoding = 'json',
+        compression: Compression = 'zlib-stream',
+        reshard_interval: float | None = None,
+        shard_ids: list[int] | None = None,
+        identify_ratelimiter: IdentifyRatelimiter | None = None,
+    ) -> None:
+        self.auto = shards is None
+        self._shards = shards or 1
         self.shards: list[Shard] = []
         self.state = state
         self.version = version
+        if encoding not in ('json', 'etf'):
+            raise GatewayException(f'Unknown Gateway encoding {encoding!r}, expected json or etf.')
+        self.encoding = encoding
+        # fails early if the compression is unknown or its package is missing
+        get_compression(compression)
+        self.compression = compression
         self.events = events
         self.token = ''
+        self.shard_ids = shard_ids
+        self.identify_ratelimiter = identify_ratelimiter or IdentifyRatelimiter()
+        self.reshard_interval = reshard_interval
+        self._reshard_task: asyncio.Task | None = None
+        self._resharding = asyncio.Lock()
+        # the shards a reshard is bringing up, until they take over
+        self._pending: list[Shard] | None = None
+
+    @property
+    def shard_count(self) -> int:
+        return self._shards
+
+    async def _gateway_bot(self) -> int:
+        # refreshes the identify limits and returns the recommended shard count
+        data = await self.state._app.http.get_gateway_bot()  # type: ignore
+        self.identify_ratelimiter.update(data['session_start_limit'])
+        return data['shards']
+
+    def _check_session_starts(self, count: int) -> None:
+        limiter = self.identify_ratelimiter
+        if limiter.remaining is not None and limiter.remaining < count:
+            _log.warning(
+                f'Only {limiter.remaining} session starts left for {count} shards, '
+                f'the rest will wait {limiter.reset_at - time.monotonic():.0f}s for them to reset.'
+            )
+
+    def _new_shards(self, count: int, dispatching: bool = True) -> list[Shard]:
+        ids = self.shard_ids if self.shard_ids is not None else range(count)
+        shards = [
+            Shard(
+                i,
+                count,
+                self.state,
+                self.events,
+                self,
+                self.version,
+                encoding=self.encoding,
+                compression=self.compression,
+            )
+            for i in ids
+        ]
+        for shard in shards:
+            shard.dispatching = dispatching
+        return shards
+
+    async def _connect_shards(self, shards: list[Shard]) -> None:
+        # shards wait for their identify slot themselves, those with different keys start together
+        await asyncio.gather(*(shard.connect(token=self.token) for shard in list(shards)))
+
+    async def _wait_until_ready(self, shards: list[Shard]) -> None:
+        # shards recreated by the disconnect hook are swapped into the list, so check it again
+        while not all(shard._ready.is_set() for shard in shards):
+            await asyncio.gather(*(shard.wait_until_ready() for shard in list(shards)))
 
     async def connect(self, token: str) -> None:
         self.token = token
 
-        for i in range(self._shards):
-            shard = Shard(i, self._shards, self.state, self.events, self.version)
-            await shard.connect(token=self.token)
-            self.shards.append(shard)
-            await asyncio.sleep(5)
+        recommended = await self._gateway_bot()
+        if self.auto:
+            self._shards = recommended
+        self._check_session_starts(len(self.shard_ids) if self.shard_ids is not None else self._shards)
+
+        # listed before connecting, so the disconnect hook finds shards which drop while starting
+        self.shards = self._new_shards(self._shards)
+        await self._connect_shards(self.shards)
+
+        if self.auto and self.reshard_interval:
+            self._reshard_task = asyncio.create_task(self._auto_reshard(self.reshard_interval))
+
+    async def reshard(self, shards: int | None = None, *, timeout: float | None = None) -> None:
+        """
+        Moves the bot onto a new number of shards without going offline.
+
+        A new set of shards is started next to the current one without dispatching
+        events. Once every new shard is ready, it takes over and the old set is closed.
+
+        Parameters:
+            shards: The new number of shards, ``None`` to use the count Discord recommends.
+            timeout: Seconds to wait for the new shards to be ready, by default enough for
+                     every identify plus a minute. The new shards are closed if it runs out.
+
+        Raises:
+            GatewayException: The manager only runs some of the bot's shards, or the new shards
+                              weren't ready in time.
+        """
+        if self.shard_ids is not None:
+            raise GatewayException('Managers running part of a cluster are resharded by restarting the cluster.')
+        async with self._resharding:
+            recommended = await self._gateway_bot()
+            count = shards or recommended
+            self._check_session_starts(count)
+
+            if timeout is None:
+                limiter = self.identify_ratelimiter
+                timeout = limiter.interval * math.ceil(count / limiter.max_concurrency) + 60
+
+            _log.info(f'Resharding from {self._shards} to {count} shards.')
+            new = self._pending = self._new_shards(count, dispatching=False)
+            try:
+                await asyncio.wait_for(self._reshard_connect(new), timeout)
+            except BaseException as exc:
+                await asyncio.gather(*(shard.close() for shard in new))
+                if isinstance(exc, asyncio.TimeoutError):
+                    raise GatewayException(f'The new shards weren\'t ready within {timeout:g}s.') from exc
+                raise
+            finally:
+                self._pending = None
+
+            old = self.shards
+            for shard in new:
+                shard.dispatching = True
+            self.shards = new
+            self._shards = count
+            await asyncio.gather(*(shard.close() for shard in old))
+            _log.info(f'Resharded onto {count} shards.')
+
+    async def _reshard_connect(self, shards: list[Shard]) -> None:
+        await self._connect_shards(shards)
+        await self._wait_until_ready(shards)
+
+    async def _auto_reshard(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                recommended = await self._gateway_bot()
+                if recommended > self._shards:
+                    await self.reshard(recommended)
+            except Exception:
+                _log.exception('Automatic resharding failed, trying again next interval.')
 
     async def disconnect(self) -> None:
-        for shard in self.shards:
-            await shard.disconnect(reconnect=False)
+        if self._reshard_task is not None:
+            self._reshard_task.cancel()
+            self._reshard_task = None
+        # closed rather than disconnected, which would have the hook replace them
+        await asyncio.gather(*(shard.close() for shard in self.shards))
 
-    async def _shard_disconnected_hook(self, shard: Shard, shard_id: int):
+    async def _shard_disconnected_hook(self, shard: Shard):
         if shard._ws.closed and shard._reconnectable:
             # the websocket is closed, we have to reconnect
             await shard.connect(token=self.token)
         elif not shard._reconnectable:
+            # a shard of a reshard in progress sits in the pending list, closed old ones in neither
+            group = next((g for g in (self.shards, self._pending) if g is not None and shard in g), None)
+            if group is None:
+                return
+
             # we cannot reconnect, so we have to recreate the shard
-            new_shard = Shard(shard_id, self._shards, self.state, self.events, self.version)
+            new_shard = Shard(
+                shard.id,
+                shard.shard_count,
+                self.state,
+                self.events,
+                self,
+                self.version,
+                encoding=self.encoding,
+                compression=self.compression,
+            )
+            new_shard.dispatching = shard.dispatching
+            group[group.index(shard)] = new_shard
             await new_shard.connect(token=self.token)
-            self.shards[shard_id] = new_shard
 
-    def shard_disconnected_hook(self, shard_id: int):
-        shard = self.shards[shard_id]
-        return asyncio.create_task(self._shard_disconnected_hook(shard, shard_id))
+    def shard_disconnected_hook(self, shard: Shard):
+        return asyncio.create_task(self._shard_disconnected_hook(shard))
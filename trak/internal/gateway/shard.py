@@ -20,11 +20,10 @@
 import asyncio
 import logging
 import platform
-import zlib
 from datetime import datetime
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Literal
 
-from aiohttp import WSMsgType
+from aiohttp import ClientWebSocketResponse, WSMsgType
 from discord_typings.gateway import GatewayEvent
 
 from trak import utils
@@ -32,14 +31,17 @@ from trak import utils
 from ...errors import GatewayException
 from ...state import BaseConnectionState
 from ..events import BaseEventDispatcher
+from . import etf
+from .compression import Compression, get_compression
 
 if TYPE_CHECKING:
     from .manager import ShardManager
 
-ZLIB_SUFFIX = b'\x00\x00\xff\xff'
-url = 'wss://gateway.discord.gg/?v={version}&encoding=json&compress=zlib-stream'
+url = 'wss://gateway.discord.gg/?v={version}&encoding={encoding}'
 _log = logging.getLogger(__name__)
 
+Encoding = Literal['json', 'etf']
+
 
 # TODO: Make a baseclass for this
 class Shard:
@@ -52,18 +54,21 @@ class Shard:
         manager: "ShardManager",
         version: int = 10,
         timeout: int = 30,
+        encoding: Encoding = 'json',
+        compression: Compression = 'zlib-stream',
     ) -> None:
         self.id = shard_id
         self.shard_count = shard_count
         self._events = events
         self.version = version
+        self.encoding = encoding
+        self._loads = etf.loads if encoding == 'etf' else utils.loads
         self._state = state
         self.manager = manager
         self._session_id: str | None = None
         self.requests_this_minute: int = 0
         self._stop_clock: bool = False
-        self._buf = bytearray()
-        self._inf = zlib.decompressobj()
+        self._compression = get_compression(compression)
         self._ratelimit_lock: asyncio.Event | None = None
         self._rot_done: asyncio.Event = asyncio.Event()
         self.current_rotation_done: bool = False
@@ -73,8 +78,14 @@ class Shard:
         self._last_heartbeat_ack: datetime | None = None
         self._heartbeat_timeout = timeout
 
+        # None until the first connect, a reshard can close shards still waiting to identify
+        self._ws: ClientWebSocketResponse = None  # type: ignore
         self._receive_task: asyncio.Task | None = None
         self._clock_task: asyncio.Task | None = None
+        self._heartbeat_task: asyncio.Task | None = None
+        self._ready = asyncio.Event()
+        # shards brought up while resharding stay quiet until they take over
+        self.dispatching: bool = True
 
         if not self._state.gateway_enabled:
             raise GatewayException(
@@ -102,14 +113,12 @@ class Shard:
             pass
 
     async def heartbeat(self, interval: float):
-        if not self.disconnected:
+        while not self._ws.closed:
             await asyncio.sleep(interval)
 
             payload = {'op': 1, 'd': self._sequence}
             await self.send(payload)
 
-        self._heartbeat_task = asyncio.create_task(self.heartbeat(), name=f'heartbeat-shard-{self.id}')
-
     async def send(self, data: dict[Any, Any]) -> None:
         if self.requests_this_minute == 119:
             if data.get('op') == 1:
@@ -124,37 +133,69 @@ class Shard:
 
         _log.debug(f'shard:{self.id}:> {data}')
 
-        payload = utils.dumps(data)
-        payload = payload.encode('utf-8')  # type: ignore
+        if self.encoding == 'etf':
+            payload = etf.dumps(data)
+        else:
+            payload = utils.dumps(data).encode('utf-8')
 
         await self._ws.send_bytes(payload)
 
         self.requests_this_minute += 1
 
     async def connect(self, token: str) -> None:
-        _log.debug(f'shard:{self.id}: Connecting to the Gateway.')
-        self._ws = await self._state._app.http._session.ws_connect(url.format(version=self.version))
+        identifying = self._session_id is None or not self._resumable
+        if identifying:
+            # wait before connecting, Discord closes connections which take too long to identify
+            await self.manager.identify_ratelimiter.acquire(self.id)
 
-        self.token = token
-        if self._session_id is None or not self._resumable:
-            await self.identify()
-        else:
-            _log.debug(f'shard:{self.id}:Reconnecting to Gateway')
-            await self.resume()
+        try:
+            _log.debug(f'shard:{self.id}: Connecting to the Gateway.')
+            # every connection starts a new compression stream
+            self._compression.reset()
+            self._stop_clock = False
+            gateway_url = url.format(version=self.version, encoding=self.encoding)
+            if self._compression.name != 'none':
+                gateway_url += f'&compress={self._compression.name}'
+            self._ws = await self._state._app.http._session.ws_connect(gateway_url)
+
+            self.token = token
+            if identifying:
+                await self.identify()
+            else:
+                _log.debug(f'shard:{self.id}:Reconnecting to Gateway')
+                await self.resume()
+        finally:
+            if identifying:
+                # the interval to the next IDENTIFY of this key starts now
+                self.manager.identify_ratelimiter.identified(self.id)
         self._receive_task = asyncio.create_task(self.receive())
         self._clock_task = asyncio.create_task(self.start_clock())
 
     async def disconnect(self, code: int = 1000, reconnect: bool = True) -> None:
-        if not self._ws.closed and self.receive_task and self.clock_task:
+        if not self._ws.closed:
             self._stop_clock = True
             self._reconnectable = reconnect
             await self._ws.close(code=code)
 
             for task in (self._receive_task, self._clock_task, self._heartbeat_task):
+                if task is not None and task is not asyncio.current_task():
+                    task.cancel()
+
+            self.manager.shard_disconnected_hook(self)
+
+    async def wait_until_ready(self) -> None:
+        await self._ready.wait()
+
+    async def close(self) -> None:
+        """Closes the shard for good, without the manager reconnecting or replacing it."""
+        self.dispatching = False
+        self._stop_clock = True
+        self._reconnectable = False
+        if self._ws is not None:
+            await self._ws.close()
+        for task in (self._receive_task, self._clock_task, self._heartbeat_task):
+            if task is not None and task is not asyncio.current_task():
                 task.cancel()
-                await task
-
-            self.manager.shard_disconnected_hook(self.id)
 
     async def receive(self) -> None:
         async for message in self._ws:
@@ -166,28 +207,31 @@ class Shard:
                     # zombified connection, reconnect
                     await self.disconnect(1008)
 
-                if message.type == WSMsgType.BINARY:
-                    if len(message.data) < 4 or message.data[-4:] != ZLIB_SUFFIX:
-                        continue
-
-                    self._buf.extend(message.data)
-
+                if message.type == WSMsgType.BINARY or message.type == WSMsgType.TEXT:
                     try:
-                        encoded = self._inf.decompress(self._buf).decode('utf-8')
-                    except:
-                        # This data was most likely corrupted
-                        self._buf = bytearray()  # clear buffer
-                        continue
-
-                    self._buf = bytearray()
-
-                    data: GatewayEvent = utils.loads(encoded)
+                        if message.type == WSMsgType.TEXT:
+                            # uncompressed json comes as text
+                            payload = message.data
+                        else:
+                            payload = self._compression.feed(message.data)
+                        if payload is None:
+                            continue
+                        data: GatewayEvent = self._loads(payload)
+                    except ValueError as exc:
+                        # nothing after this can be inflated, resume on a new stream instead
+                        _log.warning(f'shard:{self.id}:Corrupt Gateway stream ({exc!r}), reconnecting')
+                        self._resumable = True
+                        await self.disconnect(4000)
+                        break
 
-                    _log.debug(f'shard:{self.id}:< {encoded}')
+                    if _log.isEnabledFor(logging.DEBUG):
+                        _log.debug(f'shard:{self.id}:< {data}')
 
-                    self._sequence: int = data['s']
+                    if data['s'] is not None:
+                        self._sequence = data['s']
 
-                    self._events.dispatch('WEBSOCKET_MESSAGE_RECEIVE', data)
+                    if self.dispatching:
+                        self._events.dispatch('WEBSOCKET_MESSAGE_RECEIVE', data)
 
                     op = data.get('op')
                     t = data.get('t')
@@ -195,11 +239,14 @@ class Shard:
                     if op == 0:
                         if t == 'READY':
                             _log.info(f'shard:{self.id}:Connected to Gateway')
-                            self._events.dispatch('ready')
+                            if self.dispatching:
+                                self._events.dispatch('ready')
                             self._session_id = data['d']['session_id']
+                            self._ready.set()
                     elif op == 7:
                         self._resumable = True
-                        await self.disconnect()
+                        # closing with 1000 would invalidate the session
+                        await self.disconnect(4000)
                         break
                     elif op == 9:
                         self._resumable = data['d']
@@ -207,8 +254,10 @@ class Shard:
                         break
                     elif op == 10:
                         interval: float = data['d']['heartbeat_interval'] / 1000
-                        asyncio.create_task(
-                            self.heartbeat(interval=interval), name=f'initial-heartbeat-shard-{self.id}'
+                        if self._heartbeat_task is not None:
+                            self._heartbeat_task.cancel()
+                        self._heartbeat_task = asyncio.create_task(
+                            self.heartbeat(interval=interval), name=f'heartbeat-shard-{self.id}'
                         )
                     elif op == 11:
                         self._last_heartbeat_ack = (
@@ -234,7 +283,8 @@ class Shard:
                         'device': 'trak3',
                     },
                     'shard': (self.id, self.shard_count),
-                    'compress': True,
+                    # payload compression, transport compression replaces it
+                    'compress': False,
                 },
             }
         )
@@ -7,83 +7,292 @@ Trakmod's Internal HTTP Routes.
 :license: MIT, see LICENSE for more details.
 """
 
+import asyncio
+import contextlib
 import logging
-from typing import Any
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Hashable, Iterable, Iterator
 
-from aiohttp import ClientSession, FormData
+from aiohttp import ClientError, ClientSession, MultipartWriter, TCPConnector
+from discord_typings import GetGatewayBotData
 from discord_typings.resources.user import UserData
 
 from trak._info import __version__
 from trak import utils
 from trak.errors import Forbidden, HTTPException, NotFound, Unauthorized
 from trak.file import File
-from trak.internal.blocks import Block
+from trak.image import ImageSource, _resolve_image
+from trak.internal.blocks import AdaptiveConcurrency, BucketManager, GlobalRatelimiter, Priority, QueueLatency
+from trak.internal.http.bulk import BulkOperation
+from trak.internal.http.cache import AssetCache, ResponseCache
+from trak.internal.http.coordinator import CoordinatorClient
 from trak.internal.http.emoji import EmojiRoutes
 from trak.internal.http.guild import GuildRoutes
-from trak.internal.http.route import Route
+from trak.internal.http.metrics import HTTPMetrics, RequestSample, RouteMetrics
+from trak.internal.http.prepared import PreparedRequest
+from trak.internal.http.route import CompiledRoute, Route
 
 _log: logging.Logger = logging.getLogger(__name__)
+_priority: ContextVar[Priority] = ContextVar('trak_request_priority', default=Priority.NORMAL)
+
+
+@dataclass
+class PoolSettings:
+    limit: int = 100
+    """
+    The maximum number of connections open at once, 0 for no limit.
+    """
+
+    limit_per_host: int = 0
+    """
+    The maximum number of connections open to a single host, 0 for no limit.
+    """
+
+    keepalive_timeout: float = 30.0
+    """
+    How long in seconds an idle connection is kept open for reuse.
+    """
+
+    ttl_dns_cache: int | None = 300
+    """
+    How long in seconds resolved hosts are cached, ``None`` to cache forever.
+    """
+
+    warm_connections: int = 0
+    """
+    The number of connections :meth:`HTTPClient.warm_up` opens ahead of the first request.
+    """
 
 
 class HTTPClient(EmojiRoutes, GuildRoutes):
-    def __init__(self, token: str, version: int, max_retries: int = 5):
+    def __init__(
+        self,
+        token: str,
+        version: int,
+        max_retries: int = 5,
+        *,
+        global_ratelimiter: GlobalRatelimiter | None = None,
+        coalesce_requests: bool = False,
+        response_cache: ResponseCache | None = None,
+        pool: PoolSettings | None = None,
+        asset_cache: AssetCache | None = None,
+        coordinator: CoordinatorClient | None = None,
+        concurrency: AdaptiveConcurrency | None = None,
+    ):
         self._session: ClientSession | None = None
         self._headers: dict[str, str] = {'Authorization': f'Bot {token}', 'User-Agent': f'DiscordBot (https://github.com/trakmod/trakmod, {__version__})'}
 
         self.version = version
-        self._blockers: dict[str, Block] = {}
+        self._buckets = BucketManager()
+        self.pool = pool or PoolSettings()
+        # can be shared between clients using the same token
+        self.global_ratelimiter = global_ratelimiter or GlobalRatelimiter()
+        # shares ratelimits with other processes using the same token
+        self.coordinator = coordinator
+        # opt-in bound on requests in flight, growing and shrinking with how the API copes
+        self.concurrency = concurrency
         self.max_retries = max_retries
+        # identical GET requests made while one is in flight share its result
+        self.coalesce_requests = coalesce_requests
+        self._inflight: dict[tuple[str, tuple[tuple[str, str], ...] | None], asyncio.Task[Any]] = {}
+        self.response_cache = response_cache
+        self.asset_cache = asset_cache
+        self.queue_latency: dict[Priority, QueueLatency] = {p: QueueLatency() for p in Priority}
+        self.metrics = HTTPMetrics()
         self.url = f'https://discord.com/api/v{self.version}'
 
     async def create(self):
         # TODO: add support for proxies
-        self._session = ClientSession()
+        connector = TCPConnector(
+            limit=self.pool.limit,
+            limit_per_host=self.pool.limit_per_host,
+            keepalive_timeout=self.pool.keepalive_timeout,
+            ttl_dns_cache=self.pool.ttl_dns_cache,
+        )
+        self._session = ClientSession(connector=connector)
+
+    async def warm_up(self, connections: int | None = None) -> None:
+        """Opens pooled connections to the API ahead of time so early requests skip DNS, TCP and TLS setup."""
+        if not self._session:
+            await self.create()
+
+        count = self.pool.warm_connections if connections is None else connections
+        if self.pool.limit_per_host:
+            count = min(count, self.pool.limit_per_host)
+        if self.pool.limit:
+            count = min(count, self.pool.limit)
+
+        async def _open():
+            try:
+                # unauthenticated and cheap, the response is only used to get a connection into the pool
+                async with self._session.get(f'{self.url}/gateway') as r:
+                    await r.read()
+            except ClientError as exc:
+                _log.debug(f'Failed to warm up a connection: {exc!r}')
+
+        if count > 0:
+            await asyncio.gather(*(_open() for _ in range(count)))
+            _log.debug(f'Warmed up {count} connections to {self.url}')
 
-    async def request(self, method: str, route: Route, data: dict[str, Any] | None = None, *, files: list[File] | None = None, reason: str | None = None, **kwargs: Any) -> dict[str, Any] | list[dict[str, Any]] | str | None:
+    @staticmethod
+    @contextlib.contextmanager
+    def prioritize(priority: Priority) -> Iterator[None]:
+        """Sets the priority of every request made inside the block, including by tasks it creates."""
+        token = _priority.set(priority)
+        try:
+            yield
+        finally:
+            _priority.reset(token)
+
+    async def request(
+        self,
+        method: str,
+        route: Route,
+        data: dict[str, Any] | None = None,
+        *,
+        files: list[File] | None = None,
+        reason: str | None = None,
+        priority: Priority | None = None,
+        raw: bool = False,
+        **kwargs: Any,
+    ) -> dict[str, Any] | list[dict[str, Any]] | str | bytes | None:
+        cache = self.response_cache
+        # raw bodies aren't cached or coalesced, but raw mutations still invalidate the cache
+        if raw or method != 'GET' or data or files:
+            try:
+                return await self._request(
+                    method, route, data, files=files, reason=reason, priority=priority, raw=raw, **kwargs
+                )
+            finally:
+                if cache is not None and method in ('PUT', 'PATCH', 'DELETE'):
+                    cache.invalidate(route.merge(self.url))
+
+        params = kwargs.get('params')
+        key = (route.merge(self.url), tuple(sorted((k, str(v)) for k, v in params.items())) if params else None)
+
+        cacheable = cache is not None and cache.cacheable(route.path)
+        if cacheable:
+            cached = cache.get(key)  # type: ignore
+            if cached is not None:
+                return cached
+
+        if not self.coalesce_requests:
+            ret = await self._request(method, route, data, files=files, reason=reason, priority=priority, **kwargs)
+        else:
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.create_task(
+                    self._request(method, route, data, files=files, reason=reason, priority=priority, **kwargs)
+                )
+                self._inflight[key] = task
+                task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            else:
+                _log.debug(f'Coalescing request to {key[0]} with one already in flight.')
+
+            # shielded so one caller being cancelled doesn't cancel it for everyone else
+            ret = await asyncio.shield(task)
+
+        if cacheable:
+            cache.set(route.path, key, ret)  # type: ignore
+        return ret
+
+    async def _request(
+        self,
+        method: str,
+        route: Route,
+        data: dict[str, Any] | None = None,
+        *,
+        files: list[File] | None = None,
+        reason: str | None = None,
+        priority: Priority | None = None,
+        raw: bool = False,
+        prepared: PreparedRequest | None = None,
+        **kwargs: Any,
+    ) -> dict[str, Any] | list[dict[str, Any]] | str | bytes | None:
+        if priority is None:
+            priority = _priority.get()
         endpoint = route.merge(self.url)
         if not self._session:
             await self.create()
-        headers = self._headers.copy()
-        if reason:
-            headers['X-Audit-Log-Reason'] = reason
-        if files:
-            data = self._prepare_form(files, data)
-        elif data:
-            data = utils.dumps(data)
-            headers.update({"Content-Type": "application/json"})
+        if prepared is not None:
+            headers = prepared.headers
+            data = prepared.body  # type: ignore
+        else:
+            headers = self._headers.copy()
+            if reason:
+                headers['X-Audit-Log-Reason'] = reason
+            if files:
+                data = self._prepare_form(files, data)
+            elif data:
+                data = utils.dumps(data)
+                headers.update({"Content-Type": "application/json"})
+        bucket = self._buckets.get(method, route)
+        route_key = route.compiled.route_key(method)
+        metrics = self.metrics.route(route_key)
+        concurrency = self.concurrency
+        metrics.requests += 1
+        self.metrics.inflight += 1
         try:
-            for retry in range(self.max_retries):
-                if files:
-                    for f in files:
-                        f.reset(retry)
-                for blocker in self._blockers.values():
-                    if blocker.route.channel_id == route.channel_id or blocker.route.guild_id == route.guild_id or blocker.route.webhook_id == route.webhook_id or blocker.route.webhook_token == route.webhook_token:
-                        _log.debug(f'Blocking request to bucket {blocker.bucket_denom} prematurely.')
-                        await blocker.wait()
-                    elif blocker.route.path == endpoint:
-                        _log.debug(f'Blocking request to bucket {blocker.bucket_denom} prematurely.')
-                        await blocker.wait()
-                        break
-                    elif blocker.is_global:
-                        _log.debug(f'Blocking request to {endpoint} due to global ratelimit.')
-                        await blocker.wait()
-                        break
-                r = await self._session.request(method=method, url=endpoint, data=data, headers=headers, **kwargs)
+            # the form is built once and rewinds itself, so retries send it as is
+            for attempt in range(self.max_retries):
+                queued_at = time.perf_counter()
+                sent_at: float | None = None
+                shared = False
+                limited = False
+                # the bucket is re-keyed once its hash is known, the reservation stays under this one
+                key = bucket.key
+                await bucket.acquire(priority)
+                try:
+                    if concurrency is not None:
+                        await concurrency.acquire(priority)
+                        limited = True
+                    await self.global_ratelimiter.acquire(priority)
+                    if self.coordinator is not None:
+                        shared = await self.coordinator.acquire(key, priority)
+                    sent_at = time.perf_counter()
+                    self.queue_latency[priority].record(sent_at - queued_at)
+                    r = await self._session.request(method=method, url=endpoint, data=data, headers=headers, **kwargs)
+                except BaseException as exc:
+                    bucket.release()
+                    if limited:
+                        overloaded = sent_at is not None and isinstance(exc, (ClientError, asyncio.TimeoutError))
+                        concurrency.release(dropped=overloaded)  # type: ignore
+                    if shared:
+                        self.coordinator.release(key)  # type: ignore
+                    if sent_at is not None:
+                        self._record(metrics, method, route, None, queued_at, sent_at, attempt)
+                    raise
+                self._buckets.update(bucket, method, route, r.headers)
+                if shared:
+                    self.coordinator.update(key, r.headers)  # type: ignore
 
+                if r.status >= 400:
+                    r.release()
+                    if concurrency is not None:
+                        if r.status == 429 and r.headers.get('X-RateLimit-Scope') == 'shared':
+                            # the resource is busy for everyone, which says nothing about our load
+                            concurrency.release()
+                        else:
+                            latency = time.perf_counter() - sent_at
+                            overloaded = r.status == 429 or r.status >= 500
+                            concurrency.release(latency, route=route_key, dropped=overloaded)
+                    self._record(metrics, method, route, r.status, queued_at, sent_at, attempt)
                 if r.status == 429:
-                    try:
-                        bucket = r.headers['X-RateLimit-Bucket']
-                    except:
-                        continue
-                    if block := self._blockers.get(bucket):
-                        await block.wait()
+                    if r.headers.get('X-RateLimit-Global') or r.headers.get('X-RateLimit-Scope') == 'global':
+                        _log.debug(f'Blocking requests after global ratelimit on {endpoint}.')
+                        retry_after = float(r.headers.get('Retry-After', 1))
+                        self.global_ratelimiter.block(retry_after)
+                        if self.coordinator is not None:
+                            self.coordinator.block(retry_after)
+                    elif r.headers.get('X-RateLimit-Scope') == 'shared':
+                        # the resource is limited rather than our bucket, which may still have room
+                        retry_after = float(r.headers.get('Retry-After', 1))
+                        _log.debug(f'Hit shared ratelimit on {endpoint}, retrying in {retry_after}s.')
+                        await asyncio.sleep(retry_after)
                     else:
-                        block = Block(route)
-                        self._blockers[bucket] = block
-                        _log.debug(f'Blocking request to bucket {endpoint} after resource ratelimit.')
-                        await block.block(reset_after=float(r.headers['X-RateLimit-Reset-After']), bucket=bucket, globalrt=r.headers['X-RateLimit-Scope'] == 'global')
-
-                        del self._blockers[bucket]
+                        _log.debug(f'Hit ratelimit on bucket {bucket.key}, retrying after reset.')
                     continue
                 if r.status >= 400:
                     if r.status == 401:
@@ -94,58 +303,170 @@ class HTTPClient(EmojiRoutes, GuildRoutes):
                         raise NotFound
                     else:
                         raise HTTPException
-                _log.debug(f'Received {await r.text()} from request to {endpoint}')
-                return await utils._text_or_json(r)
+                # read once as bytes, the json parser takes them without a str copy
+                try:
+                    body = await r.read()
+                except BaseException:
+                    if concurrency is not None:
+                        concurrency.release()
+                    raise
+                if concurrency is not None:
+                    concurrency.release(time.perf_counter() - sent_at, route=route_key)
+                self._record(metrics, method, route, r.status, queued_at, sent_at, attempt)
+                if _log.isEnabledFor(logging.DEBUG):
+                    _log.debug(f'Received {body[:2048]!r} from request to {endpoint}')
+                if raw:
+                    return body
+                if not body:
+                    return None
+                return utils._parse_body(body, r.content_type)
         finally:
+            self.metrics.inflight -= 1
             if files:
                 for f in files:
                     f.close()
 
-    def _prepare_form(self, files: list[File], payload: dict[str, Any] = {}) -> FormData:
-        form = []
-        attachments = []
+    def prepare(
+        self, method: str, path: str, data: dict[str, Any] | None = None, *, reason: str | None = None
+    ) -> PreparedRequest:
+        """Serializes ``data`` and builds headers once, for a request to send to many routes of ``path``."""
+        headers = self._headers.copy()
+        if reason:
+            headers['X-Audit-Log-Reason'] = reason
+        body = None
+        if data:
+            body = utils.dumps(data).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        return PreparedRequest(method, CompiledRoute.get(path), body, headers)
+
+    async def send_prepared(
+        self, prepared: PreparedRequest, target: Hashable, *, priority: Priority | None = None, raw: bool = False
+    ) -> dict[str, Any] | list[dict[str, Any]] | str | bytes | None:
+        """Sends a prepared request to the route of ``target``, see :meth:`PreparedRequest.route`."""
+        return await self.request(
+            prepared.method, prepared.route(target), priority=priority, raw=raw, prepared=prepared
+        )
+
+    def broadcast(
+        self,
+        prepared: PreparedRequest,
+        targets: Iterable[Hashable],
+        *,
+        concurrency: int = 10,
+        priority: Priority = Priority.BACKGROUND,
+    ) -> BulkOperation[Hashable]:
+        """
+        Sends a prepared request to every target, streaming results back as they complete.
+
+        The body is only serialized once, and every request still goes through the ratelimiters.
+        """
+
+        async def func(target: Hashable) -> Any:
+            return await self.send_prepared(prepared, target, priority=priority)
+
+        return BulkOperation(func, targets, concurrency=concurrency)
+
+    def _record(
+        self,
+        metrics: RouteMetrics,
+        method: str,
+        route: Route,
+        status: int | None,
+        queued_at: float,
+        sent_at: float,
+        attempt: int,
+    ) -> None:
+        sample = RequestSample(method, route.path, status, time.perf_counter() - sent_at, sent_at - queued_at, attempt)
+        self.metrics.record(metrics, sample)
 
+    def _prepare_form(self, files: list[File], payload: dict[str, Any] | None = None) -> MultipartWriter:
+        payload = dict(payload or {})
+        payload["attachments"] = [
+            {"id": index, "filename": file.filename, "description": file.description}
+            for index, file in enumerate(files)
+        ]
+
+        form = MultipartWriter('form-data')
+        part = form.append(utils.dumps(payload), {'Content-Type': 'application/json'})
+        part.set_content_disposition('form-data', quote_fields=False, name='payload_json')
         for index, file in enumerate(files):
-            attachments.append({"id": index, "filename": file.filename, "description": file.description})
-            form.append(
-                {
-                    "name": f"files[{index}]",
-                    "value": file.fp,
-                    "filename": file.filename,
-                    "content_type": "application/octet-stream",
-                }
+            part = form.append_payload(file.to_payload())
+            part.set_content_disposition(
+                'form-data', quote_fields=False, name=f'files[{index}]', filename=file.filename
             )
 
-        payload["attachments"] = attachments
-        form.insert(0, {"name": "payload_json", "content_type": "application/json", "value": utils.dumps(payload)})
-        form_data = FormData(quote_fields=False)
-        for f in form:
-            form_data.add_field(**f)
+        return form
 
-        return form_data
+    @staticmethod
+    def _check_cdn_status(status: int) -> None:
+        match status:
+            case 200:
+                return
+            case 403:
+                raise Forbidden
+            case 404:
+                raise NotFound
+            case _:
+                raise HTTPException
 
     async def get_cdn_asset(self, url: str) -> bytes | None:
+        cache = self.asset_cache
+        if cache is not None:
+            data = await cache.read(url)
+            if data is not None:
+                return data
+
+        if not self._session:
+            await self.create()
         async with self._session.get(url) as response:
-            match response.status:
-                case 200:
-                    return await response.read()
-                case 403:
-                    raise Forbidden
-                case 404:
-                    raise NotFound
-                case _:
-                    raise HTTPException
+            self._check_cdn_status(response.status)
+            data = await response.read()
+
+        if cache is not None:
+            await cache.store(url, data)
+        return data
+
+    async def stream_cdn_asset(self, url: str, chunk_size: int = 2**16) -> AsyncIterator[bytes]:
+        cache = self.asset_cache
+        if cache is not None and url in cache:
+            try:
+                async for chunk in cache.iter_chunks(url, chunk_size):
+                    yield chunk
+                return
+            except FileNotFoundError:
+                # evicted by another process before we opened it
+                pass
+
+        if not self._session:
+            await self.create()
+        async with self._session.get(url) as response:
+            self._check_cdn_status(response.status)
+            pending = cache.writer(url) if cache is not None else None
+            try:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    if pending is not None:
+                        await pending.write(chunk)
+                    yield chunk
+            except BaseException:
+                if pending is not None:
+                    await pending.abort()
+                raise
+            if pending is not None:
+                await pending.commit()
+
+    async def get_gateway_bot(self) -> GetGatewayBotData:
+        return await self.request('GET', Route('/gateway/bot'))  # type: ignore
 
     async def get_me(self) -> UserData:
         return await self.request('GET', Route('/users/@me'))  # type: ignore
 
-    async def edit_me(self, username: str | None = None, avatar: str | None = None) -> UserData:
+    async def edit_me(self, username: str | None = None, avatar: ImageSource | None = None) -> UserData:
         data = {}
 
         if username:
             data['username'] = username
 
         if avatar:
-            data['avatar'] = avatar
+            data['avatar'] = await _resolve_image(avatar)
 
         return await self.request('PATCH', Route('/users/@me'), data)  # type: ignore
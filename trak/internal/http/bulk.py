@@ -0,0 +1,155 @@
+# Copyright (c) 2021-2022 VincentRPS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Generic, Hashable, Iterable, NamedTuple, TypeVar
+
+__all__ = ('BulkOperation', 'BulkResult')
+
+K = TypeVar('K', bound=Hashable)
+_log = logging.getLogger(__name__)
+
+
+class BulkResult(NamedTuple):
+    key: Any
+    result: Any
+    error: Exception | None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class BulkOperation(Generic[K]):
+    """
+    Runs one request per key concurrently and streams results back as they complete.
+
+    Iterating the operation runs it. The requests still go through the bucket and
+    global ratelimiters, so ``concurrency`` only needs to be high enough to keep the
+    bucket busy. If iteration stops early, iterating again resumes with the keys
+    that haven't completed yet, and ``pending`` can be saved to resume later.
+
+    Breaking out of ``async for`` leaves the requests in flight running until the
+    iterator is garbage collected, so use ``async with`` or call :meth:`aclose` to
+    stop them right away. Iterating again also stops a run that's still going first.
+
+    Parameters:
+        func: The coroutine function to call for each key.
+        keys: The keys to run ``func`` for; duplicates are ignored.
+        concurrency: How many requests may be in flight at once.
+
+    Attributes:
+        pending (list): Keys which have not completed yet.
+        completed (set): Keys which succeeded.
+        failed (dict): Keys which failed, mapped to the raised exception.
+    """
+
+    def __init__(self, func: Callable[[K], Awaitable[Any]], keys: Iterable[K], *, concurrency: int = 10):
+        self._func = func
+        self._pending: dict[K, None] = dict.fromkeys(keys)
+        self.completed: set[K] = set()
+        self.failed: dict[K, Exception] = {}
+        self.concurrency = concurrency
+        # the workers and results of the run in progress
+        self._workers: list[asyncio.Task[None]] = []
+        self._results: asyncio.Queue[BulkResult] | None = None
+
+    def __repr__(self) -> str:
+        return (
+            f'<BulkOperation pending={len(self._pending)} completed={len(self.completed)} failed={len(self.failed)}>'
+        )
+
+    @property
+    def pending(self) -> list[K]:
+        return list(self._pending)
+
+    @property
+    def done(self) -> bool:
+        return not self._pending
+
+    async def __aenter__(self) -> 'BulkOperation[K]':
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.aclose()
+
+    def retry_failed(self) -> None:
+        """Queues keys which failed to be run again on the next iteration."""
+        self._pending.update(dict.fromkeys(self.failed))
+        self.failed.clear()
+
+    async def _run(self, keys: Iterable[K], results: asyncio.Queue[BulkResult]) -> None:
+        # workers share one iterator, so every key is only taken once
+        for key in keys:
+            try:
+                result = await self._func(key)
+            except Exception as exc:
+                await results.put(BulkResult(key, None, exc))
+            else:
+                await results.put(BulkResult(key, result, None))
+
+    async def aclose(self) -> None:
+        """Stops the run in progress, waiting for the requests in flight to be cancelled.
+
+        Keys which didn't complete stay pending.
+        """
+        workers = self._stop()
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def _stop(self) -> list[asyncio.Task[None]]:
+        workers, results = self._workers, self._results
+        self._workers, self._results = [], None
+        for worker in workers:
+            worker.cancel()
+        if results is not None:
+            # keep track of results which finished but were never consumed
+            while not results.empty():
+                self._record(results.get_nowait())
+        return workers
+
+    async def __aiter__(self) -> AsyncIterator[BulkResult]:
+        # a run left by breaking out of the loop would send the same keys again
+        await self.aclose()
+        keys = list(self._pending)
+        if not keys:
+            return
+
+        it = iter(keys)
+        results: asyncio.Queue[BulkResult] = asyncio.Queue()
+        workers = [asyncio.create_task(self._run(it, results)) for _ in range(min(self.concurrency, len(keys)))]
+        self._workers, self._results = workers, results
+        try:
+            for _ in range(len(keys)):
+                res = await results.get()
+                self._record(res)
+                yield res
+        finally:
+            # unless a newer run or aclose() already stopped this one
+            if self._workers is workers:
+                self._stop()
+
+    def _record(self, res: BulkResult) -> None:
+        self._pending.pop(res.key, None)
+        if res.error is None:
+            self.completed.add(res.key)
+        else:
+            _log.debug(f'Bulk operation failed for {res.key}: {res.error!r}')
+            self.failed[res.key] = res.error
@@ -0,0 +1,363 @@
+# Copyright (c) 2021-2022 VincentRPS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Mapping
+
+__all__ = ('DEFAULT_TTLS', 'ResponseCache', 'AssetCache')
+
+# resources which rarely change, in seconds
+DEFAULT_TTLS: dict[str, float] = {
+    '/guilds/{guild_id}/preview': 300.0,
+    '/guilds/{guild_id}/regions': 3600.0,
+    '/guilds/{guild_id}/widget': 300.0,
+    '/guilds/{guild_id}/welcome-screen': 300.0,
+    '/guilds/{guild_id}/vanity-url': 300.0,
+}
+
+CacheKey = tuple[str, tuple[tuple[str, str], ...] | None]
+
+
+class ResponseCache:
+    """
+    A size-bounded LRU cache of GET responses, with TTLs configured per route template.
+
+    Entries are dropped when the resource they came from (or a parent of it) is
+    mutated through the same client.
+
+    !!! note
+
+        Cached responses are shared between callers, so they should not be mutated.
+
+    Parameters:
+        ttls: A mapping of route templates (e.g. ``/guilds/{guild_id}/preview``) to TTLs in seconds.
+              Routes not in the mapping are never cached.
+        max_size: The maximum number of responses to keep.
+
+    Attributes:
+        hits (int): The number of lookups served from the cache.
+        misses (int): The number of lookups of cacheable routes which missed.
+        evictions (int): The number of entries evicted to stay under ``max_size``.
+    """
+
+    def __init__(self, ttls: Mapping[str, float] | None = None, *, max_size: int = 1024):
+        self.ttls: dict[str, float] = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[CacheKey, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def cacheable(self, template: str) -> bool:
+        return template in self.ttls
+
+    def set_ttl(self, template: str, ttl: float | None) -> None:
+        if ttl is None:
+            self.ttls.pop(template, None)
+        else:
+            self.ttls[template] = ttl
+
+    def get(self, key: CacheKey) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, template: str, key: CacheKey, value: Any) -> None:
+        ttl = self.ttls.get(template)
+        if ttl is None or value is None:
+            return
+
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, url: str) -> None:
+        """Drops every cached response for ``url`` and the resources under it."""
+        # widget.json and widget.png are served from the same resource as widget
+        prefixes = (url + '/', url + '.')
+        for key in [k for k in self._entries if k[0] == url or k[0].startswith(prefixes)]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class _PendingWrite:
+    """A file being downloaded into an :class:`AssetCache`, only visible once committed."""
+
+    def __init__(self, cache: 'AssetCache', url: str) -> None:
+        self._cache = cache
+        self._url = url
+        self._loop = asyncio.get_running_loop()
+        fd, self._tmp = tempfile.mkstemp(dir=cache.directory, prefix='.', suffix='.part')
+        self._file = os.fdopen(fd, 'wb')
+        self._size = 0
+
+    async def write(self, chunk: bytes) -> None:
+        self._size += await self._loop.run_in_executor(None, self._file.write, chunk)
+
+    async def commit(self) -> None:
+        await self._loop.run_in_executor(None, self._file.close)
+        await self._cache._commit(self._url, self._tmp, self._size)
+
+    async def abort(self) -> None:
+        def _abort():
+            self._file.close()
+            os.remove(self._tmp)
+
+        await self._loop.run_in_executor(None, _abort)
+
+
+class AssetCache:
+    """
+    A size-bounded LRU cache of CDN assets on disk, with an in-memory tier for small ones.
+
+    Asset URLs never change content for a given key, format and size, so files are
+    named after a hash of the URL and never need revalidating. Files are written to a
+    temporary name and renamed into place, so a partially written asset is never read.
+
+    Parameters:
+        directory: Where cached assets are stored, created if it doesn't exist.
+        max_size: The maximum number of bytes kept on disk.
+        memory_max_size: The maximum number of bytes kept in memory.
+        memory_item_size: Assets larger than this are only cached on disk.
+
+    Attributes:
+        hits (int): The number of reads served from disk or memory.
+        memory_hits (int): The number of reads served from memory.
+        misses (int): The number of reads which had to go to the CDN.
+    """
+
+    def __init__(
+        self,
+        directory: str | os.PathLike,
+        *,
+        max_size: int = 256 * 1024 * 1024,
+        memory_max_size: int = 8 * 1024 * 1024,
+        memory_item_size: int = 64 * 1024,
+    ):
+        self.directory = os.fspath(directory)
+        self.max_size = max_size
+        self.memory_max_size = memory_max_size
+        self.memory_item_size = memory_item_size
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # file name -> size, least recently used first
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self._size = 0
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_size = 0
+
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith('.'):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._size += size
+
+    def __contains__(self, url: str) -> bool:
+        return self._name(url) in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @staticmethod
+    def _name(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _remember(self, name: str, data: bytes) -> None:
+        if len(data) > self.memory_item_size:
+            return
+        if name not in self._memory:
+            self._memory_size += len(data)
+        self._memory[name] = data
+        self._memory.move_to_end(name)
+        while self._memory_size > self.memory_max_size:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _forget(self, name: str) -> None:
+        size = self._index.pop(name, None)
+        if size is not None:
+            self._size -= size
+        data = self._memory.pop(name, None)
+        if data is not None:
+            self._memory_size -= len(data)
+
+    async def _touch(self, name: str) -> None:
+        self._index.move_to_end(name)
+
+        def _utime() -> None:
+            # keeps the order across restarts, failures only lose ordering
+            try:
+                os.utime(self._path(name))
+            except OSError:
+                pass
+
+        await asyncio.get_running_loop().run_in_executor(None, _utime)
+
+    async def read(self, url: str) -> bytes | None:
+        name = self._name(url)
+        if name not in self._index:
+            self.misses += 1
+            return None
+
+        data = self._memory.get(name)
+        if data is not None:
+            self._memory.move_to_end(name)
+            self._index.move_to_end(name)
+            self.hits += 1
+            self.memory_hits += 1
+            return data
+
+        def _read() -> bytes:
+            with open(self._path(name), 'rb') as f:
+                return f.read()
+
+        loop = asyncio.get_running_loop()
+        try:
+            data = await loop.run_in_executor(None, _read)
+        except FileNotFoundError:
+            # removed under us, most likely by another process sharing the directory
+            self._forget(name)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._remember(name, data)
+        await self._touch(name)
+        return data
+
+    async def iter_chunks(self, url: str, chunk_size: int = 2**16) -> AsyncIterator[bytes]:
+        name = self._name(url)
+        data = self._memory.get(name)
+        if data is not None:
+            self._memory.move_to_end(name)
+            self._index.move_to_end(name)
+            self.hits += 1
+            self.memory_hits += 1
+            for offset in range(0, len(data), chunk_size):
+                yield data[offset : offset + chunk_size]
+            return
+
+        loop = asyncio.get_running_loop()
+        try:
+            f = await loop.run_in_executor(None, open, self._path(name), 'rb')
+        except FileNotFoundError:
+            self._forget(name)
+            raise
+        self.hits += 1
+        try:
+            while chunk := await loop.run_in_executor(None, f.read, chunk_size):
+                yield chunk
+        finally:
+            await loop.run_in_executor(None, f.close)
+        await self._touch(name)
+
+    def writer(self, url: str) -> _PendingWrite:
+        """Starts writing an asset in chunks, see :meth:`store` for writing it in one go."""
+        self.misses += 1
+        return _PendingWrite(self, url)
+
+    async def store(self, url: str, data: bytes) -> None:
+        pending = _PendingWrite(self, url)
+        try:
+            await pending.write(data)
+        except BaseException:
+            await pending.abort()
+            raise
+        await pending.commit()
+        self._remember(self._name(url), data)
+
+    async def _commit(self, url: str, tmp: str, size: int) -> None:
+        name = self._name(url)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, os.replace, tmp, self._path(name))
+
+        self._forget(name)
+        self._index[name] = size
+        self._size += size
+
+        evicted = []
+        while self._size > self.max_size and len(self._index) > 1:
+            old, _ = next(iter(self._index.items()))
+            self._forget(old)
+            evicted.append(self._path(old))
+
+        def _remove() -> None:
+            for path in evicted:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+        if evicted:
+            await loop.run_in_executor(None, _remove)
+
+    async def clear(self) -> None:
+        paths = [self._path(name) for name in self._index]
+        self._index.clear()
+        self._memory.clear()
+        self._size = self._memory_size = 0
+
+        def _remove() -> None:
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+        await asyncio.get_running_loop().run_in_executor(None, _remove)
@@ -0,0 +1,287 @@
+# Copyright (c) 2021-2022 VincentRPS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Shares ratelimits between processes using the same token.
+
+A :class:`RatelimitCoordinator` runs as a local sidecar on a unix socket, and every
+:class:`~trak.internal.http.HTTPClient` given a :class:`CoordinatorClient` reserves
+bucket and global capacity through it before sending a request. The sidecar can be
+started with ``python -m trak.internal.http.coordinator <socket path>``.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, Mapping
+
+from trak import utils
+from trak.internal.blocks import Bucket, GlobalRatelimiter, Priority, parse_ratelimit_headers
+
+__all__ = ('RatelimitCoordinator', 'CoordinatorClient')
+
+_log = logging.getLogger(__name__)
+
+
+class RatelimitCoordinator:
+    """
+    Holds the bucket and global ratelimits of every connected client.
+
+    Clients send newline-delimited JSON messages:
+
+    - ``{"op": "acquire", "id": 1, "bucket": "...", "priority": 1}``, answered with ``{"id": 1}``
+      once both the bucket and global ratelimit let the request through.
+    - ``{"op": "update", "bucket": "...", "limit": 5, "remaining": 4, "reset_after": 1.0}`` once a
+      granted request has a response, ``{"op": "lift", "bucket": "..."}`` if the response had no
+      ratelimit headers, or ``{"op": "release", "bucket": "..."}`` if it didn't get one.
+    - ``{"op": "block", "retry_after": 1.0}`` after a global 429.
+
+    Everything runs on a single event loop, so reservations are atomic.
+
+    Parameters:
+        path: The unix socket path to listen on.
+        rate: The number of requests allowed per period under the global ratelimit.
+        per: The length of the global ratelimit's period in seconds.
+        prune_interval: How often, in seconds, buckets that are idle get dropped.
+    """
+
+    def __init__(self, path: str, *, rate: int = 50, per: float = 1.0, prune_interval: float = 60.0):
+        self.path = path
+        self.global_ratelimiter = GlobalRatelimiter(rate, per)
+        self._buckets: dict[str, Bucket] = {}
+        self._prune_interval = prune_interval
+        self._last_prune = time.monotonic()
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        _log.info(f'Ratelimit coordinator listening on {self.path}')
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        await self._server.serve_forever()  # type: ignore
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def _bucket(self, key: str) -> Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._maybe_prune()
+            bucket = self._buckets[key] = Bucket(key)
+        return bucket
+
+    def _maybe_prune(self) -> None:
+        now = time.monotonic()
+        if now - self._last_prune < self._prune_interval:
+            return
+        self._last_prune = now
+        # buckets with reservations out are never idle, so a later update/release still finds them
+        for key in [k for k, b in self._buckets.items() if b.idle]:
+            del self._buckets[key]
+
+    async def _grant(self, message: dict[str, Any], writer: asyncio.StreamWriter, granted: Counter[str]) -> None:
+        key = message['bucket']
+        bucket = self._bucket(key)
+        priority = Priority(message.get('priority', Priority.NORMAL))
+        await bucket.acquire(priority)
+        try:
+            await self.global_ratelimiter.acquire(priority)
+        except BaseException:
+            bucket.release()
+            raise
+        granted[key] += 1
+        writer.write(utils.dumps({'id': message['id']}).encode('utf-8') + b'\n')
+
+    def _finish(self, key: str, granted: Counter[str]) -> Bucket | None:
+        # the bucket a client's reservation was held on, if it had one
+        if granted[key] <= 0:
+            return None
+        granted[key] -= 1
+        return self._bucket(key)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # reservations held by this client, handed back if it goes away mid-request
+        granted: Counter[str] = Counter()
+        pending: set[asyncio.Task[None]] = set()
+        try:
+            while line := await reader.readline():
+                message = utils.loads(line)
+                op = message.get('op')
+                if op == 'acquire':
+                    task = asyncio.create_task(self._grant(message, writer, granted))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                elif op == 'update':
+                    if bucket := self._finish(message['bucket'], granted):
+                        bucket.update(message['limit'], message['remaining'], message['reset_after'])
+                elif op == 'lift':
+                    if bucket := self._finish(message['bucket'], granted):
+                        bucket.lift()
+                elif op == 'release':
+                    if bucket := self._finish(message['bucket'], granted):
+                        bucket.release()
+                elif op == 'block':
+                    self.global_ratelimiter.block(message['retry_after'])
+        except (ConnectionError, ValueError) as exc:
+            _log.debug(f'Coordinator client disconnected: {exc!r}')
+        finally:
+            for task in pending:
+                task.cancel()
+            for key, count in granted.items():
+                for _ in range(count):
+                    self._bucket(key).release()
+            writer.close()
+
+
+class CoordinatorClient:
+    """
+    Reserves ratelimit capacity through a :class:`RatelimitCoordinator`.
+
+    If the coordinator can't be reached, requests are only held by the client's own
+    ratelimits, and reconnecting is retried every ``reconnect_interval`` seconds.
+
+    Parameters:
+        path: The unix socket path the coordinator listens on.
+        reconnect_interval: How long to wait between attempts to reach the coordinator.
+    """
+
+    def __init__(self, path: str, *, reconnect_interval: float = 5.0):
+        self.path = path
+        self.reconnect_interval = reconnect_interval
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task[None] | None = None
+        self._waiters: dict[int, asyncio.Future[None]] = {}
+        # acquires which were cancelled before being granted, with their bucket
+        self._abandoned: dict[int, str] = {}
+        self._next_id = 0
+        self._next_attempt = 0.0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self) -> bool:
+        if self.connected:
+            return True
+
+        loop = asyncio.get_running_loop()
+        if loop.time() < self._next_attempt:
+            return False
+        try:
+            reader, self._writer = await asyncio.open_unix_connection(self.path)
+        except OSError as exc:
+            self._next_attempt = loop.time() + self.reconnect_interval
+            _log.warning(f'Could not reach ratelimit coordinator at {self.path}: {exc!r}')
+            return False
+
+        self._reader_task = asyncio.create_task(self._read(reader))
+        return True
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+
+    def _send(self, message: dict[str, Any]) -> None:
+        if self.connected:
+            self._writer.write(utils.dumps(message).encode('utf-8') + b'\n')  # type: ignore
+
+    async def _read(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while line := await reader.readline():
+                id = utils.loads(line)['id']
+                fut = self._waiters.pop(id, None)
+                if fut is not None and not fut.done():
+                    fut.set_result(None)
+                elif (key := self._abandoned.pop(id, None)) is not None:
+                    self._send({'op': 'release', 'bucket': key})
+        except (ConnectionError, ValueError) as exc:
+            _log.warning(f'Lost connection to ratelimit coordinator: {exc!r}')
+        finally:
+            self._writer = None
+            self._abandoned.clear()
+            # let waiting requests fall back to local ratelimits
+            for fut in self._waiters.values():
+                if not fut.done():
+                    fut.set_result(None)
+            self._waiters.clear()
+
+    async def acquire(self, bucket: str, priority: Priority = Priority.NORMAL) -> bool:
+        """Waits until the coordinator grants a request to ``bucket``, returns whether one was granted."""
+        if not await self.connect():
+            return False
+
+        self._next_id += 1
+        id = self._next_id
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[id] = fut
+        self._send({'op': 'acquire', 'id': id, 'bucket': bucket, 'priority': int(priority)})
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if self._waiters.pop(id, None) is not None:
+                self._abandoned[id] = bucket
+            else:
+                # granted just before we were cancelled
+                self._send({'op': 'release', 'bucket': bucket})
+            raise
+        return self.connected
+
+    def update(self, bucket: str, headers: Mapping[str, str]) -> None:
+        limits = parse_ratelimit_headers(headers)
+        if limits is None:
+            self._send({'op': 'lift', 'bucket': bucket})
+        else:
+            limit, remaining, reset_after = limits
+            self._send(
+                {'op': 'update', 'bucket': bucket, 'limit': limit, 'remaining': remaining, 'reset_after': reset_after}
+            )
+
+    def release(self, bucket: str) -> None:
+        self._send({'op': 'release', 'bucket': bucket})
+
+    def block(self, retry_after: float) -> None:
+        self._send({'op': 'block', 'retry_after': retry_after})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Runs a ratelimit coordinator for trakmod processes sharing a token.')
+    parser.add_argument('path', help='the unix socket path to listen on')
+    parser.add_argument('--rate', type=int, default=50, help='requests allowed per period under the global ratelimit')
+    parser.add_argument('--per', type=float, default=1.0, help='the length of the global period in seconds')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(RatelimitCoordinator(args.path, rate=args.rate, per=args.per).serve_forever())
+
+
+if __name__ == '__main__':
+    main()
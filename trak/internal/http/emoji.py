@@ -19,34 +19,36 @@
 # SOFTWARE.
 from discord_typings import EmojiData, Snowflake
 
+from trak.image import ImageSource, _resolve_image
 from trak.internal.http.route import Route
 from trak.mixins import RouteCategoryMixin
 
 
 class EmojiRoutes(RouteCategoryMixin):
     async def list_guild_emojis(self, guild_id: Snowflake) -> EmojiData:
-        return await self.request("GET", Route(f"/guilds/{guild_id}/emojis"), None)
+        return await self.request("GET", Route("/guilds/{guild_id}/emojis", guild_id=guild_id), None)
 
     async def get_guild_emoji(self, guild_id: Snowflake, emoji_id: Snowflake) -> EmojiData:
-        return await self.request("GET", Route(f"/guilds/{guild_id}/emojis/{emoji_id}"), None)
+        return await self.request(
+            "GET", Route("/guilds/{guild_id}/emojis/{emoji_id}", guild_id=guild_id, emoji_id=emoji_id), None
+        )
 
-    # TODO: image to `Asset`
     async def create_guild_emoji(
         self,
         guild_id: Snowflake,
         *,
         name: str,
-        image: bytes,
+        image: ImageSource,
         roles: list[Snowflake] | None = None,
         reason: str | None = None,
     ) -> EmojiData:
         payload = {
             "name": name,
-            "image": image,
+            "image": await _resolve_image(image),
             "roles": roles or [],
         }
 
-        return await self.request("POST", Route(f"/guilds/{guild_id}/emojis"), payload, reason=reason)
+        return await self.request("POST", Route("/guilds/{guild_id}/emojis", guild_id=guild_id), payload, reason=reason)
 
     async def modify_guild_emoji(
         self,
@@ -63,7 +65,17 @@ class EmojiRoutes(RouteCategoryMixin):
         if roles is not ...:
             payload["roles"] = roles or []
 
-        return await self.request("PATCH", Route(f"/guilds/{guild_id}/emojis/{emoji_id}"), payload, reason=reason)
+        return await self.request(
+            "PATCH",
+            Route("/guilds/{guild_id}/emojis/{emoji_id}", guild_id=guild_id, emoji_id=emoji_id),
+            payload,
+            reason=reason,
+        )
 
     async def delete_guild_emoji(self, guild_id: Snowflake, emoji_id: Snowflake, *, reason: str | None = None) -> None:
-        return await self.request("DELETE", Route(f"/guilds/{guild_id}/emojis/{emoji_id}"), None, reason=reason)
+        return await self.request(
+            "DELETE",
+            Route("/guilds/{guild_id}/emojis/{emoji_id}", guild_id=guild_id, emoji_id=emoji_id),
+            None,
+            reason=reason,
+        )
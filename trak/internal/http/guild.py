@@ -18,6 +18,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import datetime
+from typing import Iterable
 
 from discord_typings import (
     BanData,
@@ -40,18 +41,21 @@ from discord_typings import (
     WelcomeScreenData,
 )
 
+from trak.image import ImageSource, _resolve_image
+from trak.internal.blocks import Priority
+from trak.internal.http.bulk import BulkOperation
+from trak.internal.http.pagination import Paginator
 from trak.internal.http.route import Route
 from trak.mixins import RouteCategoryMixin
 from trak.types import ModifyMFALevelData, PrunedData
 
 
 class GuildRoutes(RouteCategoryMixin):
-    # TODO: icon to `Asset`
     async def create_guild(
         self,
         *,
         name: str,
-        icon: bytes | None = None,
+        icon: ImageSource | None = None,
         verification_level: int | None = None,
         default_message_notifications: int | None = None,
         explicit_content_filter: int | None = None,
@@ -64,7 +68,7 @@ class GuildRoutes(RouteCategoryMixin):
     ) -> GuildData:
         payload = {'name': name}
         if icon is not None:
-            payload['icon'] = icon
+            payload['icon'] = await _resolve_image(icon)
         if verification_level is not None:
             payload['verification_level'] = verification_level
         if default_message_notifications is not None:
@@ -86,13 +90,12 @@ class GuildRoutes(RouteCategoryMixin):
         return await self.request('POST', Route('/guilds'), payload)
 
     async def get_guild(self, guild_id: Snowflake, with_counts: bool = False) -> GuildData:
-        params = {'with_counts': with_counts}
+        params = {'with_counts': 'true' if with_counts else 'false'}
         return await self.request('GET', Route('/guilds/{guild_id}', guild_id=guild_id), params=params)
 
     async def get_guild_preview(self, guild_id: Snowflake) -> GuildPreviewData:
         return await self.request('GET', Route('/guilds/{guild_id}/preview', guild_id=guild_id), None)
 
-    # TODO: icon, splash, discovery_splash, banner to `Asset`
     async def modify_guild(
         self,
         guild_id: Snowflake,
@@ -104,11 +107,11 @@ class GuildRoutes(RouteCategoryMixin):
         explicit_content_filter: int | None = ...,
         afk_channel_id: Snowflake | None = ...,
         afk_timeout: int = ...,
-        icon: bytes | None = ...,
+        icon: ImageSource | None = ...,
         owner_id: Snowflake = ...,
-        splash: bytes | None = ...,
-        discovery_splash: bytes | None = ...,
-        banner: bytes | None = ...,
+        splash: ImageSource | None = ...,
+        discovery_splash: ImageSource | None = ...,
+        banner: ImageSource | None = ...,
         system_channel_id: Snowflake | None = ...,
         system_channel_flags: int = ...,
         rules_channel_id: Snowflake | None = ...,
@@ -132,15 +135,15 @@ class GuildRoutes(RouteCategoryMixin):
         if afk_timeout is not ...:
             payload['afk_timeout'] = afk_timeout
         if icon is not ...:
-            payload['icon'] = icon
+            payload['icon'] = await _resolve_image(icon)
         if owner_id is not ...:
             payload['owner_id'] = owner_id
         if splash is not ...:
-            payload['splash'] = splash
+            payload['splash'] = await _resolve_image(splash)
         if discovery_splash is not ...:
-            payload['discovery_splash'] = discovery_splash
+            payload['discovery_splash'] = await _resolve_image(discovery_splash)
         if banner is not ...:
-            payload['banner'] = banner
+            payload['banner'] = await _resolve_image(banner)
         if system_channel_id is not ...:
             payload['system_channel_id'] = system_channel_id
         if system_channel_flags is not ...:
@@ -245,6 +248,19 @@ class GuildRoutes(RouteCategoryMixin):
 
         return await self.request('GET', Route('/guilds/{guild_id}/members', guild_id=guild_id), params=params)
 
+    def iter_guild_members(
+        self,
+        guild_id: Snowflake,
+        *,
+        limit: int | None = None,
+        after: Snowflake | None = None,
+        page_size: int = 1000,
+    ) -> Paginator[GuildMemberData]:
+        async def fetch(after: Snowflake | None, size: int) -> list[GuildMemberData]:
+            return await self.list_guild_members(guild_id, limit=size, after=after)
+
+        return Paginator(fetch, lambda m: m['user']['id'], limit=limit, after=after, page_size=page_size)
+
     async def search_guild_members(
         self, guild_id: Snowflake, *, query: str, limit: int | None = None
     ) -> list[GuildMemberData]:
@@ -352,6 +368,56 @@ class GuildRoutes(RouteCategoryMixin):
             reason=reason,
         )
 
+    def _bulk_member_role(
+        self,
+        method: str,
+        guild_id: Snowflake,
+        role_id: Snowflake,
+        user_ids: Iterable[Snowflake],
+        reason: str | None,
+        concurrency: int,
+        priority: Priority,
+    ) -> BulkOperation[Snowflake]:
+        async def func(user_id: Snowflake) -> None:
+            return await self.request(
+                method,
+                Route(
+                    '/guilds/{guild_id}/members/{user_id}/roles/{role_id}',
+                    guild_id=guild_id,
+                    user_id=user_id,
+                    role_id=role_id,
+                ),
+                None,
+                reason=reason,
+                priority=priority,
+            )
+
+        return BulkOperation(func, user_ids, concurrency=concurrency)
+
+    def bulk_add_guild_member_role(
+        self,
+        guild_id: Snowflake,
+        role_id: Snowflake,
+        user_ids: Iterable[Snowflake],
+        *,
+        reason: str | None = None,
+        concurrency: int = 10,
+        priority: Priority = Priority.BACKGROUND,
+    ) -> BulkOperation[Snowflake]:
+        return self._bulk_member_role('PUT', guild_id, role_id, user_ids, reason, concurrency, priority)
+
+    def bulk_remove_guild_member_role(
+        self,
+        guild_id: Snowflake,
+        role_id: Snowflake,
+        user_ids: Iterable[Snowflake],
+        *,
+        reason: str | None = None,
+        concurrency: int = 10,
+        priority: Priority = Priority.BACKGROUND,
+    ) -> BulkOperation[Snowflake]:
+        return self._bulk_member_role('DELETE', guild_id, role_id, user_ids, reason, concurrency, priority)
+
     async def remove_guild_member(self, guild_id: Snowflake, user_id: Snowflake, *, reason: str | None = None) -> None:
         return await self.request(
             'DELETE',
@@ -375,7 +441,20 @@ class GuildRoutes(RouteCategoryMixin):
             params['before'] = before
         if after is not None:
             params['after'] = after
-        return await self.request('GET', Route('/guilds/{guild_id}/bans', guild_id=guild_id), None)
+        return await self.request('GET', Route('/guilds/{guild_id}/bans', guild_id=guild_id), params=params)
+
+    def iter_guild_bans(
+        self,
+        guild_id: Snowflake,
+        *,
+        limit: int | None = None,
+        after: Snowflake | None = None,
+        page_size: int = 1000,
+    ) -> Paginator[BanData]:
+        async def fetch(after: Snowflake | None, size: int) -> list[BanData]:
+            return await self.get_guild_bans(guild_id, limit=size, after=after)
+
+        return Paginator(fetch, lambda b: b['user']['id'], limit=limit, after=after, page_size=page_size)
 
     async def get_guild_ban(self, guild_id: Snowflake, user_id: Snowflake) -> BanData:
         return await self.request(
@@ -411,7 +490,6 @@ class GuildRoutes(RouteCategoryMixin):
     async def get_guild_roles(self, guild_id: Snowflake) -> list[RoleData]:
         return await self.request('GET', Route('/guilds/{guild_id}/roles', guild_id=guild_id), None)
 
-    # TODO: icon to `Asset`
     async def create_guild_role(
         self,
         guild_id: Snowflake,
@@ -420,7 +498,7 @@ class GuildRoutes(RouteCategoryMixin):
         permissions: int | None = None,
         color: int | None = None,
         hoist: bool | None = None,
-        icon: bytes | None = None,
+        icon: ImageSource | None = None,
         unicode_emoji: str | None = None,
         mentionable: bool | None = None,
         reason: str | None = None,
@@ -435,7 +513,7 @@ class GuildRoutes(RouteCategoryMixin):
         if hoist is not None:
             payload['hoist'] = hoist
         if icon is not None:
-            payload['icon'] = icon
+            payload['icon'] = await _resolve_image(icon)
         if unicode_emoji is not None:
             payload['unicode_emoji'] = unicode_emoji
         if mentionable is not None:
@@ -458,7 +536,7 @@ class GuildRoutes(RouteCategoryMixin):
         permissions: int | None = ...,
         color: int | None = ...,
         hoist: bool | None = ...,
-        icon: bytes | None = ...,
+        icon: ImageSource | None = ...,
         unicode_emoji: str | None = ...,
         mentionable: bool | None = ...,
         reason: str | None = None,
@@ -473,7 +551,7 @@ class GuildRoutes(RouteCategoryMixin):
         if hoist is not ...:
             payload['hoist'] = hoist
         if icon is not ...:
-            payload['icon'] = icon
+            payload['icon'] = await _resolve_image(icon)
         if unicode_emoji is not ...:
             payload['unicode_emoji'] = unicode_emoji
         if mentionable is not ...:
@@ -589,7 +667,7 @@ class GuildRoutes(RouteCategoryMixin):
             params['style'] = style
 
         return await self.request(  # type: ignore
-            'GET', Route('/guilds/{guild_id}/widget.png', guild_id=guild_id), params
+            'GET', Route('/guilds/{guild_id}/widget.png', guild_id=guild_id), params=params, raw=True
         )
 
     async def get_guild_welcome_screen(self, guild_id: Snowflake) -> WelcomeScreenData:
@@ -0,0 +1,205 @@
+# Copyright (c) 2021-2022 VincentRPS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import bisect
+import logging
+from collections import Counter
+from typing import Any, Callable, NamedTuple
+
+__all__ = ('Histogram', 'RouteMetrics', 'RequestSample', 'HTTPMetrics')
+
+_log = logging.getLogger(__name__)
+
+# upper bounds in seconds, roughly doubling from 1ms to 30s
+DEFAULT_BOUNDS: tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+class Histogram:
+    """
+    A fixed-bucket histogram of durations in seconds.
+
+    Parameters:
+        bounds: The upper bound of each bucket, in ascending order.
+                Anything above the last bound goes into an overflow bucket.
+    """
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, bounds: tuple[float, ...] = DEFAULT_BOUNDS) -> None:
+        self.bounds = bounds
+        self.counts: list[int] = [0] * (len(bounds) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.max: float = 0.0
+
+    def __repr__(self) -> str:
+        return f'<Histogram count={self.count} mean={self.mean:.4f} p99={self.percentile(0.99):.4f}>'
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """An upper bound for the ``q`` (0-1) quantile, taken from the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'buckets': dict(zip((*self.bounds, float('inf')), self.counts)),
+        }
+
+
+class RouteMetrics:
+    """
+    Counters for a single method and route template.
+
+    Attributes:
+        latency (Histogram): Time from sending a request to having read its response, per attempt.
+        ratelimit_wait (Histogram): Time requests spent held by bucket and global ratelimits.
+        statuses (Counter): Responses received by status code.
+        requests (int): Requests made, not counting retries.
+        retries (int): Attempts made after the first one.
+        ratelimited (int): 429 responses received.
+        errors (int): Attempts which failed without a response.
+    """
+
+    __slots__ = ('latency', 'ratelimit_wait', 'statuses', 'requests', 'retries', 'ratelimited', 'errors')
+
+    def __init__(self) -> None:
+        self.latency = Histogram()
+        self.ratelimit_wait = Histogram()
+        self.statuses: Counter[int] = Counter()
+        self.requests: int = 0
+        self.retries: int = 0
+        self.ratelimited: int = 0
+        self.errors: int = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'ratelimited': self.ratelimited,
+            'errors': self.errors,
+            'statuses': dict(self.statuses),
+            'latency': self.latency.as_dict(),
+            'ratelimit_wait': self.ratelimit_wait.as_dict(),
+        }
+
+
+class RequestSample(NamedTuple):
+    """A single attempt at a request, handed to hooks added with :meth:`HTTPMetrics.add_hook`."""
+
+    method: str
+    template: str
+    status: int | None
+    latency: float
+    ratelimit_wait: float
+    attempt: int
+
+
+class HTTPMetrics:
+    """
+    Instrumentation for an :class:`~trak.internal.http.HTTPClient`.
+
+    Metrics are kept per method and route template (e.g. ``GET /guilds/{guild_id}``)
+    and can be read from here at any time, or pushed elsewhere with a hook.
+
+    Attributes:
+        routes (dict): :class:`RouteMetrics` keyed by method and route template.
+        statuses (Counter): Responses received by status code, across every route.
+        inflight (int): Requests currently being made, including ones held by ratelimits.
+    """
+
+    def __init__(self) -> None:
+        self.routes: dict[str, RouteMetrics] = {}
+        self.statuses: Counter[int] = Counter()
+        self.inflight: int = 0
+        self._hooks: list[Callable[[RequestSample], Any]] = []
+
+    def route(self, key: str) -> RouteMetrics:
+        metrics = self.routes.get(key)
+        if metrics is None:
+            metrics = self.routes[key] = RouteMetrics()
+        return metrics
+
+    def add_hook(self, hook: Callable[[RequestSample], Any]) -> None:
+        """Calls ``hook`` with a :class:`RequestSample` after every attempt, it must not block."""
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[RequestSample], Any]) -> None:
+        self._hooks.remove(hook)
+
+    def record(self, metrics: RouteMetrics, sample: RequestSample) -> None:
+        metrics.ratelimit_wait.observe(sample.ratelimit_wait)
+        if sample.status is None:
+            metrics.errors += 1
+        else:
+            metrics.latency.observe(sample.latency)
+            metrics.statuses[sample.status] += 1
+            self.statuses[sample.status] += 1
+            if sample.status == 429:
+                metrics.ratelimited += 1
+        if sample.attempt:
+            metrics.retries += 1
+
+        for hook in self._hooks:
+            try:
+                hook(sample)
+            except Exception:
+                _log.exception(f'Metrics hook {hook!r} failed')
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            'inflight': self.inflight,
+            'statuses': dict(self.statuses),
+            'routes': {key: metrics.as_dict() for key, metrics in self.routes.items()},
+        }
@@ -0,0 +1,93 @@
+# Copyright (c) 2021-2022 VincentRPS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Generic, TypeVar
+
+from discord_typings import Snowflake
+
+__all__ = ('Paginator',)
+
+T = TypeVar('T')
+
+
+class Paginator(Generic[T]):
+    """
+    Streams items from an ``after``-cursor paginated endpoint.
+
+    The next page is requested in the background while the current one is being
+    consumed, and at most two pages are held at any time.
+
+    Parameters:
+        fetch: A coroutine function taking the ``after`` cursor and a page size, returning a page.
+        key: Returns the snowflake used as the cursor for the page after an item.
+        limit: The maximum number of items to yield, ``None`` for all of them.
+        after: Only yield items after this snowflake.
+        page_size: The number of items requested per page.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[Snowflake | None, int], Awaitable[list[T]]],
+        key: Callable[[T], Snowflake],
+        *,
+        limit: int | None = None,
+        after: Snowflake | None = None,
+        page_size: int = 1000,
+    ):
+        self._fetch = fetch
+        self._key = key
+        self.limit = limit
+        self.after = after
+        self.page_size = page_size
+
+    def _request(self, after: Snowflake | None, remaining: int | None) -> asyncio.Task[list[T]]:
+        size = self.page_size if remaining is None else min(self.page_size, remaining)
+        return asyncio.create_task(self._fetch(after, size))
+
+    async def __aiter__(self) -> AsyncIterator[T]:
+        remaining = self.limit
+        if remaining is not None and remaining <= 0:
+            return
+
+        size = self.page_size if remaining is None else min(self.page_size, remaining)
+        task: asyncio.Task[list[T]] | None = self._request(self.after, remaining)
+        try:
+            while task is not None:
+                page = await task
+                task = None
+                if not page:
+                    return
+
+                if remaining is not None:
+                    page = page[:remaining]
+                    remaining -= len(page)
+
+                # a short page means there is nothing left to fetch
+                if len(page) >= size and (remaining is None or remaining > 0):
+                    self.after = self._key(page[-1])
+                    task = self._request(self.after, remaining)
+                    size = self.page_size if remaining is None else min(self.page_size, remaining)
+
+                for item in page:
+                    yield item
+                del page
+        finally:
+            if task is not None:
+                task.cancel()
@@ -0,0 +1,63 @@
+# Copyright (c) 2021-2022 VincentRPS
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from typing import Any, Hashable, Mapping
+
+from trak.internal.http.route import CompiledRoute, Route
+
+__all__ = ('PreparedRequest',)
+
+
+class PreparedRequest:
+    """
+    A request with its body and headers built once, to be sent to many routes of a template.
+
+    Create these with :meth:`HTTPClient.prepare <trak.internal.http.HTTPClient.prepare>`.
+
+    Attributes:
+        method (str): The request's HTTP method.
+        compiled (CompiledRoute): The template the request is sent to.
+        body (bytes | None): The serialized JSON body.
+        headers (Mapping): The headers sent with every request, which must not be changed.
+    """
+
+    __slots__ = ('method', 'compiled', 'body', 'headers')
+
+    def __init__(self, method: str, compiled: CompiledRoute, body: bytes | None, headers: Mapping[str, str]) -> None:
+        self.method = method
+        self.compiled = compiled
+        self.body = body
+        self.headers = headers
+
+    def __repr__(self) -> str:
+        return f'<PreparedRequest method={self.method!r} template={self.compiled.template!r}>'
+
+    def route(self, target: Hashable) -> Route:
+        """
+        The route to send the request to for ``target``.
+
+        ``target`` is the template's only parameter, like a channel id, or a tuple
+        of its parameters in the order they appear in the template.
+        """
+        fields = self.compiled.fields
+        if len(fields) == 1:
+            params: dict[str, Any] = {fields[0]: target}
+        else:
+            params = dict(zip(fields, target))  # type: ignore
+        return Route(self.compiled.template, **params)
@@ -17,10 +17,66 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+from functools import lru_cache
+from string import Formatter
+
 from discord_typings import Snowflake
 
+MAJOR_PARAMETERS = frozenset(('guild_id', 'channel_id', 'webhook_id', 'webhook_token'))
+# the library's own templates are well under this, it only bounds paths formatted before being routed
+MAX_COMPILED_ROUTES = 1024
+
+
+class CompiledRoute:
+    """
+    A route template parsed once, shared by every :class:`Route` using it.
+
+    Use :meth:`get` instead of creating these directly, so templates in use are only compiled once.
+    """
+
+    __slots__ = ('template', 'fields', '_fmt', '_route_keys')
+
+    def __init__(self, template: str) -> None:
+        self.template = template
+
+        fmt: list[str] = []
+        fields: list[str] = []
+        for literal, field, _, _ in Formatter().parse(template):
+            fmt.append(literal.replace('%', '%%'))
+            if field is not None:
+                fmt.append('%s')
+                fields.append(field)
+
+        self.fields: tuple[str, ...] = tuple(fields)
+        self._fmt = ''.join(fmt)
+        self._route_keys: dict[str, str] = {}
+
+    def __repr__(self) -> str:
+        return f'<CompiledRoute template={self.template!r}>'
+
+    @staticmethod
+    def get(template: str) -> 'CompiledRoute':
+        return _compile(template)
+
+    def route_key(self, method: str) -> str:
+        """The key used to look up the bucket hash of this template for ``method``."""
+        key = self._route_keys.get(method)
+        if key is None:
+            key = self._route_keys[method] = f'{method} {self.template}'
+        return key
+
+    def format(self, values: tuple[object, ...]) -> str:
+        return self._fmt % values if self.fields else self._fmt
+
+
+@lru_cache(maxsize=MAX_COMPILED_ROUTES)
+def _compile(template: str) -> CompiledRoute:
+    return CompiledRoute(template)
+
 
 class BaseRoute:
+    __slots__ = ()
+
     def __init__(
         self,
         path: str,
@@ -37,6 +93,17 @@ class BaseRoute:
 
 
 class Route(BaseRoute):
+    __slots__ = (
+        'compiled',
+        'guild_id',
+        'channel_id',
+        'webhook_id',
+        'webhook_token',
+        'parameters',
+        '_major',
+        '_merged',
+    )
+
     def __init__(
         self,
         path: str,
@@ -46,7 +113,7 @@ class Route(BaseRoute):
         webhook_token: str | None = None,
         **parameters: str | int,
     ):
-        self.path = path
+        self.compiled = _compile(path)
 
         # major parameters
         self.guild_id = guild_id
@@ -56,11 +123,28 @@ class Route(BaseRoute):
 
         self.parameters = parameters
 
+        self._major: str | None = None
+        self._merged: str | None = None
+
+    def __repr__(self) -> str:
+        return f'<Route path={self.path!r} major={self.major!r}>'
+
+    @property
+    def path(self) -> str:
+        return self.compiled.template
+
+    @property
+    def major(self) -> str:
+        """Identifies which ratelimit bucket of a template this route falls in."""
+        if self._major is None:
+            self._major = f'{self.guild_id}:{self.channel_id}:{self.webhook_id}:{self.webhook_token}'
+        return self._major
+
     def merge(self, url: str):
-        return url + self.path.format(
-            guild_id=self.guild_id,
-            channel_id=self.channel_id,
-            webhook_id=self.webhook_id,
-            webhook_token=self.webhook_token,
-            **self.parameters,
-        )
+        # routes are merged a few times per request, so the path is only built once
+        if self._merged is None:
+            params = self.parameters
+            self._merged = self.compiled.format(
+                tuple([getattr(self, f) if f in MAJOR_PARAMETERS else params[f] for f in self.compiled.fields])
+            )
+        return url + self._merged
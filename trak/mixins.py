@@ -19,15 +19,17 @@
 # SOFTWARE.
 from __future__ import annotations
 
+import asyncio
 import io
 import os
-from typing import TYPE_CHECKING, Any, Protocol
+from typing import TYPE_CHECKING, Any, AsyncIterator, Protocol
 
 from aiohttp import ClientSession
 from discord_typings import Snowflake
 
 if TYPE_CHECKING:
     from trak.file import File
+    from trak.internal.blocks import Priority
     from trak.internal.http.route import Route
     from trak.state import BaseConnectionState
 
@@ -64,11 +66,15 @@ class BaseAssetMixin(Protocol):
     async def read(self) -> bytes | None:
         pass
 
+    def stream(self, chunk_size: int = 2**16) -> AsyncIterator[bytes]:
+        pass
+
     async def save(
         self,
         file_path: str | bytes | os.PathLike | io.BufferedIOBase,
         *,
         seek_to_beginning: bool = True,
+        chunk_size: int = 2**16,
     ) -> int | None:
         pass
 
@@ -87,14 +93,34 @@ class AssetMixin(BaseAssetMixin):
         """
         return await self._state._app.http.get_cdn_asset(self.url)
 
+    async def stream(self, chunk_size: int = 2**16) -> AsyncIterator[bytes]:
+        """Retrieves the asset in chunks as they arrive, without holding all of it in memory.
+
+        Parameters:
+            chunk_size: The maximum size of each chunk in bytes.
+
+        Raises:
+            Forbidden: You don't have permission to access the asset.
+            NotFound: The asset was not found.
+            HTTPException: Getting the asset failed.
+
+        Yields:
+            The asset's contents as [bytes][] chunks.
+        """
+        async for chunk in self._state._app.http.stream_cdn_asset(self.url, chunk_size):
+            yield chunk
+
     async def save(
         self,
         file_path: str | bytes | os.PathLike | io.BufferedIOBase,
         *,
         seek_to_beginning: bool = True,
+        chunk_size: int = 2**16,
     ) -> int | None:
         """Saves the asset into a file-like object.
 
+        The asset is streamed in chunks and written off the event loop.
+
         Raises:
             Forbidden: You don't have permission to access the asset.
             NotFound: The asset was not found.
@@ -103,15 +129,26 @@ class AssetMixin(BaseAssetMixin):
         Returns:
             The number of bytes written.
         """
-        data = await self.read()
-        if isinstance(file_path, io.BufferedIOBase):
-            written = file_path.write(data)
-            if seek_to_beginning:
-                file_path.seek(0)
-            return written
-        else:
-            with open(file_path, "wb") as file:
-                return file.write(data)
+        loop = asyncio.get_running_loop()
+        owner = not isinstance(file_path, io.BufferedIOBase)
+        file = await loop.run_in_executor(None, open, file_path, 'wb') if owner else file_path
+
+        written = 0
+        try:
+            async for chunk in self.stream(chunk_size):
+                written += await loop.run_in_executor(None, file.write, chunk)
+        except BaseException:
+            if owner:
+                # don't leave a partially downloaded file behind
+                await loop.run_in_executor(None, file.close)
+                await loop.run_in_executor(None, os.remove, file_path)
+            raise
+
+        if owner:
+            await loop.run_in_executor(None, file.close)
+        elif seek_to_beginning:
+            file.seek(0)
+        return written
 
 
 class RouteCategoryMixin:
@@ -125,6 +162,8 @@ class RouteCategoryMixin:
         *,
         files: list[File] | None = None,
         reason: str = None,
+        priority: Priority | None = None,
+        raw: bool = False,
         **kwargs: Any,
-    ) -> dict[str, Any] | list[dict[str, Any]] | str | None:
+    ) -> dict[str, Any] | list[dict[str, Any]] | str | bytes | None:
         ...
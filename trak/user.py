@@ -23,9 +23,10 @@ from typing import Protocol
 
 from discord_typings.resources import UserData
 
+from trak.image import ImageSource
 from trak.mixins import Hashable
 from trak.state import BaseConnectionState
-from trak.utils import _convert_base64_from_bytes, grab_creation_time
+from trak.utils import grab_creation_time
 
 
 class BaseUser(Protocol):
@@ -53,7 +54,7 @@ class BaseUser(Protocol):
 
 
 class BaseCurrentUser(BaseUser):
-    async def edit(self, username: str | None = None, avatar: bytes | None = None) -> None:
+    async def edit(self, username: str | None = None, avatar: ImageSource | None = None) -> None:
         pass
 
 
@@ -88,13 +89,10 @@ class User(BaseUser, Hashable):
 
 
 class CurrentUser(User, BaseCurrentUser):
-    async def edit(self, username: str | None = None, avatar: bytes | None = None) -> None:
+    async def edit(self, username: str | None = None, avatar: ImageSource | None = None) -> None:
         if not username and not avatar:
             return
 
-        if avatar:
-            avatar = _convert_base64_from_bytes(avatar)  # type: ignore
-
         edited = await self._state._app.http.edit_me(username=username, avatar=avatar)  # type: ignore
 
         self.username = edited['username']
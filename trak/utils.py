@@ -27,19 +27,19 @@ except ImportError:
 
     HAS_ORJSON = False
 
-from base64 import b64encode
 from datetime import datetime, timezone
 from typing import Any, Literal, TypeVar, Tuple
 
-from aiohttp import ClientResponse
-
 EPOCH = 1420070400000
 
 
-async def _text_or_json(rp: ClientResponse):
-    if rp.content_type == 'application/json':
-        return await rp.json(loads=loads, encoding='utf-8')
-    return await rp.text(encoding='utf-8')
+def _parse_body(body: bytes, content_type: str) -> Any:
+    # parses a body which has already been read, without decoding it to text first
+    if content_type == 'application/json':
+        return loads(body)
+    if content_type.startswith('text/'):
+        return body.decode('utf-8')
+    return body
 
 
 def dumps(obj: Any) -> str:
@@ -68,13 +68,6 @@ def _get_image_mime_type(data: bytes):
         raise ValueError('Image type given is unsupported by discord')
 
 
-def _convert_base64_from_bytes(data: bytes) -> str:
-    fmt = 'data:{mime};base64,{data}'
-    mime = _get_image_mime_type(data)
-    b64 = b64encode(data).decode('ascii')
-    return fmt.format(mime=mime, data=b64)
-
-
 # this might be slow?
 def _validate_image_params(key: str, fmt: str, size: int) -> Tuple[str, int]:
     # format validation